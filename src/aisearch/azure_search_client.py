@@ -1,23 +1,166 @@
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 logging.basicConfig(level=logging.INFO)
 
 
-def create_resource(resource_url, headers, definition, resource_name):
-    logging.info(f"Creating {resource_name}")
-    response = requests.put(resource_url, headers=headers, json=definition)
-    if response.status_code == 200:
-        logging.info(f"{resource_name} created successfully")
-    elif response.status_code == 201:
-        logging.info(f"{resource_name} updated successfully")
-    elif response.status_code in [202, 204]:
-        # no change
-        logging.info(f"{resource_name} already exists, no change")
-    else:
-        logging.error(
-            f"{resource_name} creation failed with status code {response.status_code}"
+class SearchClient:
+    """
+    Azure AI Search REST client sharing one pooled session.
+
+    Requests throttled by the service (429/503) are retried with exponential
+    backoff, honouring Retry-After.
+    """
+
+    def __init__(
+        self,
+        endpoint,
+        api_key,
+        api_version,
+        client_request_id=None,
+        pool_size=8,
+        max_retries=5,
+        backoff_factor=1.0,
+    ):
+        """
+        :param endpoint: Azure AI Search endpoint URL.
+        :param api_key: Azure AI Search admin key.
+        :param api_version: Default API version; calls can override it.
+        :param client_request_id: Sent as x-ms-client-request-id with every call.
+        :param pool_size: Connections kept open, at least the number of parallel calls.
+        :param max_retries: Retries of a throttled call before its response is returned.
+        :param backoff_factor: Base of the exponential backoff in seconds.
+        """
+        self.endpoint = endpoint.rstrip("/")
+        self.api_version = api_version
+        self.session = requests.Session()
+        self.session.headers["api-key"] = api_key
+        if client_request_id:
+            self.session.headers["x-ms-client-request-id"] = client_request_id
+        retry = Retry(
+            total=max_retries,
+            status_forcelist=(429, 503),
+            allowed_methods=None,  # PUT/DELETE of a definition and search.run are safe to repeat
+            backoff_factor=backoff_factor,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
         )
-        logging.info(response.json())
-    return response
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path, api_version=None):
+        return f"{self.endpoint}/{path}?api-version={api_version or self.api_version}"
+
+    def request(self, method, path, api_version=None, **kwargs):
+        return self.session.request(method, self.url(path, api_version), **kwargs)
+
+    def create_resource(self, path, definition, resource_name, api_version=None):
+        """
+        Creates or updates a resource with PUT.
+
+        :param path: Resource path, e.g. indexes/<name>.
+        :param definition: The resource definition.
+        :param resource_name: Name used for logging.
+        :return: The response.
+        """
+        logging.info(f"Creating {resource_name}")
+        response = self.request("PUT", path, api_version, json=definition)
+        if response.status_code == 200:
+            logging.info(f"{resource_name} created successfully")
+        elif response.status_code == 201:
+            logging.info(f"{resource_name} updated successfully")
+        elif response.status_code in [202, 204]:
+            # no change
+            logging.info(f"{resource_name} already exists, no change")
+        else:
+            logging.error(
+                f"{resource_name} creation failed with status code {response.status_code}"
+            )
+            logging.info(response.json())
+        return response
+
+    def delete_resource(self, path, resource_type, api_version=None):
+        """
+        Deletes a resource; a missing resource only logs a warning.
+
+        :param path: Resource path, e.g. indexes/<name>.
+        :param resource_type: The type of resource being deleted (for logging).
+        :return: The response.
+        """
+        response = self.request("DELETE", path, api_version)
+        if response.status_code == 204:
+            logging.info(f"{resource_type} deleted successfully.")
+        elif response.status_code == 404:
+            logging.warning(f"{resource_type} not found.")
+        else:
+            logging.error(
+                f"Failed to delete {resource_type}. Status code: {response.status_code}"
+            )
+            logging.error(f"Response: {response.text}")
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+def run_with_dependencies(steps, max_workers=4):
+    """
+    Runs steps concurrently, each one as soon as the steps it depends on succeeded.
+
+    A step that fails (raises) is logged, and the steps depending on it are skipped.
+
+    :param steps: Dict of step name to (callable, names of the steps it depends on).
+    :param max_workers: Steps running at the same time.
+    :return: Dict of step name to the callable's result for the steps that succeeded.
+    :raises RuntimeError: If a step failed or was skipped.
+    """
+    unknown = {
+        dependency
+        for _, dependencies in steps.values()
+        for dependency in dependencies
+        if dependency not in steps
+    }
+    if unknown:
+        raise ValueError(f"Unknown dependencies: {sorted(unknown)}")
+
+    results = {}
+    failed = set()
+    remaining = dict(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while remaining or running:
+            skipped = True
+            while skipped:
+                skipped = False
+                for name, (step, dependencies) in list(remaining.items()):
+                    if failed.intersection(dependencies):
+                        logging.error(f"Skipping {name}: a step it depends on failed.")
+                        failed.add(name)
+                        del remaining[name]
+                        skipped = True
+                    elif all(dependency in results for dependency in dependencies):
+                        running[executor.submit(step)] = name
+                        del remaining[name]
+            if not running:
+                if remaining:
+                    raise ValueError(f"Dependency cycle between {sorted(remaining)}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logging.error(f"{name} failed: {e}")
+                    failed.add(name)
+    if failed:
+        raise RuntimeError(f"Steps failed or skipped: {sorted(failed)}")
+    return results
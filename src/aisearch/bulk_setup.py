@@ -0,0 +1,194 @@
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure_search_client import SearchClient, run_with_dependencies
+from config import (
+    AI_SEARCH_ADMIN_KEY,
+    AI_SEARCH_ENDPOINT,
+    AI_SEARCH_SEARCH_API_VERSION,
+)
+from definitions import (
+    build_definitions,
+    resource_collections,
+    resource_labels,
+    resource_plan,
+    x_ms_client_request_id,
+)
+from setup import api_version_for
+
+logging.basicConfig(level=logging.INFO)
+
+# Secrets the service does not return (null or "<redacted>"), by property name;
+# ("cognitiveServices", "key") names a property by its parent as well.
+SECRET_PROPERTIES = (
+    ("connectionString",),
+    ("storageConnectionString",),
+    ("apiKey",),
+    ("cognitiveServices", "key"),
+)
+REDACTED_VALUES = (None, "<redacted>")
+
+
+def load_manifest(path):
+    """
+    Reads the use cases to provision.
+
+    The manifest is a JSON list (or an object with a "usecases" list) of
+    {"name": ..., "container": ..., "shards": [...]} entries; container and
+    shards (blob prefixes, see resource_plan) are optional.
+
+    :param path: Path of the manifest file.
+    :return: List of use case dicts.
+    """
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    usecases = manifest["usecases"] if isinstance(manifest, dict) else manifest
+    names = [usecase["name"] for usecase in usecases]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate use case names in {path}: {sorted(duplicates)}")
+    return usecases
+
+
+def is_secret(path):
+    return any(tuple(path[-len(secret) :]) == secret for secret in SECRET_PROPERTIES)
+
+
+def definition_matches(desired, live, path=()):
+    """
+    True if every value of the desired definition is already live.
+
+    Properties only the live definition has (defaults, @odata.etag) are
+    ignored, and so are secrets (SECRET_PROPERTIES), which the service does
+    not return. Any other value missing from the live definition is a change.
+    """
+    if isinstance(desired, dict):
+        return isinstance(live, dict) and all(
+            definition_matches(value, live.get(key), path + (key,))
+            for key, value in desired.items()
+        )
+    if isinstance(desired, list):
+        return (
+            isinstance(live, list)
+            and len(desired) == len(live)
+            and all(definition_matches(d, l, path) for d, l in zip(desired, live))
+        )
+    if isinstance(desired, str) and live in REDACTED_VALUES and is_secret(path):
+        return True
+    return desired == live
+
+
+def sync_step(client, key, kind, definition, force, outcomes):
+    label = f"{resource_labels[kind]} {definition['name']}"
+    path = f"{resource_collections[kind]}/{definition['name']}"
+
+    def step():
+        if not force:
+            response = client.request("GET", path, api_version_for(kind))
+            if response.status_code == 200 and definition_matches(
+                definition, response.json()
+            ):
+                logging.info(f"{label} is up to date")
+                outcomes[key] = "unchanged"
+                return
+            if response.status_code not in (200, 404):
+                response.raise_for_status()
+        response = client.create_resource(path, definition, label, api_version_for(kind))
+        response.raise_for_status()
+        outcomes[key] = "updated"
+
+    return step
+
+
+def provision_usecase(client, usecase, force):
+    """
+    Brings one use case in line with its rendered definitions.
+
+    :return: Summary dict with the elapsed time and what happened to each resource.
+    """
+    plan = resource_plan(
+        build_definitions(usecase["name"], usecase.get("container")),
+        usecase.get("shards", ()),
+    )
+    outcomes = {}
+    steps = {
+        key: (sync_step(client, key, kind, definition, force, outcomes), dependencies)
+        for key, (kind, definition, dependencies) in plan.items()
+    }
+    started = time.perf_counter()
+    error = None
+    try:
+        run_with_dependencies(steps, max_workers=4)
+    except Exception as e:
+        error = str(e)
+        logging.error(f"Use case {usecase['name']} failed: {e}")
+    return {
+        "usecase": usecase["name"],
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "updated": sorted(
+            key for key, outcome in outcomes.items() if outcome == "updated"
+        ),
+        "unchanged": sorted(
+            key for key, outcome in outcomes.items() if outcome == "unchanged"
+        ),
+        "error": error,
+    }
+
+
+def print_summary(summaries, elapsed):
+    print(f"\n{'use case':<30} {'seconds':>8}  result")
+    for summary in sorted(summaries, key=lambda row: row["elapsed_s"], reverse=True):
+        if summary["error"]:
+            result = f"FAILED: {summary['error']}"
+        elif summary["updated"]:
+            result = f"updated {', '.join(summary['updated'])}"
+        else:
+            result = "unchanged"
+        print(f"{summary['usecase']:<30} {summary['elapsed_s']:>8}  {result}")
+    failed = sum(1 for summary in summaries if summary["error"])
+    print(f"\n{len(summaries)} use cases in {elapsed:.1f}s, {failed} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create or update the Search resources of many use cases"
+    )
+    parser.add_argument("manifest", help="JSON manifest of the use cases")
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Use cases provisioned at the same time"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="PUT every definition without comparing (e.g. after rotating a secret)",
+    )
+    parser.add_argument("--output", help="Write the per use case summary as JSON")
+    args = parser.parse_args()
+
+    usecases = load_manifest(args.manifest)
+    # Each use case runs up to four calls at a time.
+    client = SearchClient(
+        AI_SEARCH_ENDPOINT,
+        AI_SEARCH_ADMIN_KEY,
+        AI_SEARCH_SEARCH_API_VERSION,
+        client_request_id=x_ms_client_request_id,
+        pool_size=4 * args.concurrency,
+    )
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            summaries = list(
+                executor.map(
+                    lambda usecase: provision_usecase(client, usecase, args.force),
+                    usecases,
+                )
+            )
+    finally:
+        client.close()
+    print_summary(summaries, time.perf_counter() - started)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(summaries, output_file, indent=2)
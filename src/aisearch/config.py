@@ -15,6 +15,12 @@ AI_SEARCH_SKILLSET_API_VERSION = os.getenv("AI_SEARCH_SKILLSET_API_VERSION")
 STORAGE_ACCOUNT_NAME = os.getenv("STORAGE_ACCOUNT_NAME")
 # storage_account_connection_string = os.getenv("STORAGE_ACCOUNT_CONNECTION_STRING")
 STORAGE_ACCOUNT_CONTAINER = os.getenv("STORAGE_ACCOUNT_CONTAINER")
+# Comma-separated blob prefixes (virtual folders); one data source and indexer per prefix
+INDEXER_SHARD_PREFIXES = [
+    prefix.strip()
+    for prefix in os.getenv("INDEXER_SHARD_PREFIXES", "").split(",")
+    if prefix.strip()
+]
 AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME = os.getenv(
     "AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"
 )
@@ -23,7 +29,34 @@ AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
 AI_MULTIACCOUT_KEY = os.getenv("AI_MULTIACCOUT_KEY")
 
+# Incremental enrichment: the indexer caches skill outputs and only reruns what changed
+ENRICHMENT_CACHE = os.getenv("ENRICHMENT_CACHE", "false").lower() == "true"
+# Defaults to the data source's storage account (managed identity)
+ENRICHMENT_CACHE_CONNECTION_STRING = os.getenv("ENRICHMENT_CACHE_CONNECTION_STRING")
+
 FUNCTION_KEY = os.getenv("FUNCTION_KEY")
 FUNCTION_ENDPOINT = os.getenv("FUNCTION_ENDPOINT")
 
 FUNCTION_APP_CLIENT_ID = os.getenv("FUNCTION_APP_CLIENT_ID")
+# Timeout of the image analysis skill (1-230s); also sent to the function as its deadline
+SKILL_TIMEOUT_SECONDS = int(os.getenv("SKILL_TIMEOUT_SECONDS", "30"))
+
+# Tuned batchSize/degreeOfParallelism of the image analysis skill, written by tune.py
+SKILL_TUNING_FILE = os.getenv("SKILL_TUNING_FILE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "skill_tuning.json"
+)
+
+
+def get_function_auth():
+    """
+    Authenticates against the Function App like the indexer does.
+
+    :return: Tuple of (query params, headers): the function key if FUNCTION_KEY
+        is set, else an Entra ID token for FUNCTION_APP_CLIENT_ID.
+    """
+    if FUNCTION_KEY:
+        return {"code": FUNCTION_KEY}, {}
+    from azure.identity import DefaultAzureCredential
+
+    token = DefaultAzureCredential().get_token(f"api://{FUNCTION_APP_CLIENT_ID}/.default")
+    return {}, {"Authorization": f"Bearer {token.token}"}
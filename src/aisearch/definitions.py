@@ -1,3 +1,6 @@
+import copy
+import json
+import os
 import uuid
 
 from config import (
@@ -5,10 +8,15 @@ from config import (
     AZURE_OPENAI_API_KEY,
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME,
     AZURE_OPENAI_ENDPOINT,
+    ENRICHMENT_CACHE,
+    ENRICHMENT_CACHE_CONNECTION_STRING,
     FUNCTION_APP_CLIENT_ID,
     FUNCTION_ENDPOINT,
     FUNCTION_KEY,
+    INDEXER_SHARD_PREFIXES,
     RESOURCE_GROUP_NAME,
+    SKILL_TIMEOUT_SECONDS,
+    SKILL_TUNING_FILE,
     STORAGE_ACCOUNT_CONTAINER,
     STORAGE_ACCOUNT_NAME,
     SUBSCRIPTION_ID,
@@ -22,6 +30,47 @@ data_source_name = f"{USECASE_NAME}-datasource"
 skillset_name = f"{USECASE_NAME}-skillset"
 x_ms_client_request_id = str(uuid.uuid4())
 
+# Search REST collection, display name and referenced resources of each resource kind.
+resource_collections = {
+    "datasource": "datasources",
+    "index": "indexes",
+    "skillset": "skillsets",
+    "indexer": "indexers",
+}
+resource_labels = {
+    "datasource": "Data Source",
+    "index": "Index",
+    "skillset": "Skillset",
+    "indexer": "Indexer",
+}
+# The skillset projects into the index; the indexer needs all three.
+resource_dependencies = {
+    "datasource": (),
+    "index": (),
+    "skillset": ("index",),
+    "indexer": ("datasource", "index", "skillset"),
+}
+
+
+def load_skill_tuning(path=SKILL_TUNING_FILE):
+    """
+    Loads the image analysis skill settings chosen by tune.py.
+
+    :param path: Path of the tuning file.
+    :return: Dict with batchSize and degreeOfParallelism (defaults if the file does not exist).
+    """
+    tuning = {"batchSize": 4, "degreeOfParallelism": 5}
+    if os.path.exists(path):
+        with open(path) as tuning_file:
+            saved = json.load(tuning_file)
+        tuning.update(
+            {key: saved[key] for key in ("batchSize", "degreeOfParallelism") if key in saved}
+        )
+    return tuning
+
+
+image_analysis_skill_tuning = load_skill_tuning()
+
 
 # Connection string for managed identity
 storage_account_connection_string = f"ResourceId=/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{RESOURCE_GROUP_NAME}/providers/Microsoft.Storage/storageAccounts/{STORAGE_ACCOUNT_NAME};"
@@ -162,11 +211,12 @@ skillset_definition = {
             "@odata.type": "#Microsoft.Skills.Custom.WebApiSkill",
             "name": "image_analysis_skill",
             "description": "Extracts text and captions from images using Azure AI Vision Image Analysis v4.0",
-            "uri": f"{FUNCTION_ENDPOINT}/api/aivisionapiv4?code={FUNCTION_KEY}&use_caption=true",
+            "uri": f"{FUNCTION_ENDPOINT}/api/aivisionapiv4?code={FUNCTION_KEY}&use_caption=true&deadline_seconds={SKILL_TIMEOUT_SECONDS}",
             "authResourceId": f"api://{FUNCTION_APP_CLIENT_ID}/.default",  #  This property takes an application (client) ID or app's registration in Microsoft Entra ID, in any of these formats: api://<appId>, <appId>/.default, api://<appId>/.default
             "httpMethod": "POST",
-            "batchSize": 4,
-            "degreeOfParallelism": 5,  # (Optional) When specified, indicates the number of calls the indexer makes in parallel to the endpoint you provide. You can decrease this value if your endpoint is failing under pressure, or raise it if your endpoint can handle the load. If not set, a default value of 5 is used. The degreeOfParallelism can be set to a maximum of 10 and a minimum of 1.
+            "timeout": f"PT{SKILL_TIMEOUT_SECONDS}S",
+            "batchSize": image_analysis_skill_tuning["batchSize"],
+            "degreeOfParallelism": image_analysis_skill_tuning["degreeOfParallelism"],  # (Optional) When specified, indicates the number of calls the indexer makes in parallel to the endpoint you provide. You can decrease this value if your endpoint is failing under pressure, or raise it if your endpoint can handle the load. If not set, a default value of 5 is used. The degreeOfParallelism can be set to a maximum of 10 and a minimum of 1.
             "context": "/document/normalized_images/*",
             "inputs": [
                 {"name": "image", "source": "/document/normalized_images/*/data"},
@@ -302,3 +352,116 @@ indexer_definition = {
         # }
     ],
 }
+
+if ENRICHMENT_CACHE:
+    # enableReprocessing lets the indexer rerun skills whose definition changed;
+    # skills upstream of the change (e.g. image analysis) are served from the cache.
+    indexer_definition["cache"] = {
+        "storageConnectionString": ENRICHMENT_CACHE_CONNECTION_STRING
+        or storage_account_connection_string,
+        "enableReprocessing": True,
+    }
+
+
+def build_definitions(usecase_name, container=None):
+    """
+    Renders the definitions above for another use case, e.g. one tenant of bulk_setup.py.
+
+    :param usecase_name: Prefix of the resource names, like USECASE_NAME.
+    :param container: Blob container of the data source; defaults to STORAGE_ACCOUNT_CONTAINER.
+    :return: Dict of resource kind (datasource, index, skillset, indexer) to its definition.
+    """
+    names = {
+        "datasource": f"{usecase_name}-datasource",
+        "index": f"{usecase_name}-index",
+        "skillset": f"{usecase_name}-skillset",
+        "indexer": f"{usecase_name}-indexer",
+    }
+
+    datasource = copy.deepcopy(datasource_definition)
+    datasource["name"] = names["datasource"]
+    if container:
+        datasource["container"] = {"name": container}
+
+    index = copy.deepcopy(index_definition)
+    index["name"] = names["index"]
+
+    skillset = copy.deepcopy(skillset_definition)
+    skillset["name"] = names["skillset"]
+    for selector in skillset["indexProjections"]["selectors"]:
+        selector["targetIndexName"] = names["index"]
+
+    indexer = copy.deepcopy(indexer_definition)
+    indexer.update(
+        {
+            "name": names["indexer"],
+            "dataSourceName": names["datasource"],
+            "targetIndexName": names["index"],
+            "skillsetName": names["skillset"],
+        }
+    )
+
+    return {
+        "datasource": datasource,
+        "index": index,
+        "skillset": skillset,
+        "indexer": indexer,
+    }
+
+
+def resource_plan(definitions, shard_prefixes=()):
+    """
+    Lists the resources of a definition set, optionally sharded by blob prefix.
+
+    With shard prefixes, the data source and indexer are replaced by one pair
+    per prefix; every shard indexer writes to the same index with the same
+    skillset, so a backfill runs as len(shard_prefixes) indexers in parallel.
+
+    :param definitions: Dict of resource kind to definition, as returned by build_definitions.
+    :param shard_prefixes: Blob prefixes (virtual folders) of the shards.
+    :return: Dict of resource key to (kind, definition, keys of the resources it references).
+    """
+    if not shard_prefixes:
+        return {
+            kind: (kind, definition, resource_dependencies[kind])
+            for kind, definition in definitions.items()
+        }
+
+    plan = {
+        "index": ("index", definitions["index"], ()),
+        "skillset": ("skillset", definitions["skillset"], ("index",)),
+    }
+    for shard, prefix in enumerate(shard_prefixes):
+        datasource = copy.deepcopy(definitions["datasource"])
+        datasource["name"] = f"{datasource['name']}-{shard}"
+        datasource["container"]["query"] = prefix
+        indexer = copy.deepcopy(definitions["indexer"])
+        indexer["name"] = f"{indexer['name']}-{shard}"
+        indexer["dataSourceName"] = datasource["name"]
+        plan[f"datasource-{shard}"] = ("datasource", datasource, ())
+        plan[f"indexer-{shard}"] = (
+            "indexer",
+            indexer,
+            (f"datasource-{shard}", "index", "skillset"),
+        )
+    return plan
+
+
+resources = resource_plan(
+    {
+        "datasource": datasource_definition,
+        "index": index_definition,
+        "skillset": skillset_definition,
+        "indexer": indexer_definition,
+    },
+    INDEXER_SHARD_PREFIXES,
+)
+# Every indexer of this use case: indexer_name, or one per shard.
+indexer_names = [
+    definition["name"] for kind, definition, _ in resources.values() if kind == "indexer"
+]
+data_source_names = [
+    definition["name"]
+    for kind, definition, _ in resources.values()
+    if kind == "datasource"
+]
@@ -1,43 +1,57 @@
 import json
 import logging
 import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+
+from azure_search_client import SearchClient, run_with_dependencies
 from config import (
     AI_SEARCH_ENDPOINT,
     AI_SEARCH_SEARCH_API_VERSION,
+    AI_SEARCH_SKILLSET_API_VERSION,
     AI_SEARCH_ADMIN_KEY,
+    FUNCTION_ENDPOINT,
+    get_function_auth,
 )
+from indexer_monitor import IndexerMonitor, aggregate_samples, write_series
 from definitions import (
+    data_source_names,
     index_name,
-    indexer_name,
+    indexer_names,
+    resource_collections,
+    resource_labels,
+    resources,
     skillset_name,
-    data_source_name,
     x_ms_client_request_id,
 )
 
 logging.basicConfig(level=logging.INFO)
 
 
-def check_indexer_status(indexer_name, ai_search_endpoint, api_key, api_version):
+def get_search_client():
+    return SearchClient(
+        AI_SEARCH_ENDPOINT,
+        AI_SEARCH_ADMIN_KEY,
+        AI_SEARCH_SEARCH_API_VERSION,
+        client_request_id=x_ms_client_request_id,
+    )
+
+
+def check_indexer_status(client, indexer_name):
     """
     Checks the status of the specified indexer and logs the result.
 
+    :param client: SearchClient to use.
     :param indexer_name: Name of the indexer to check.
-    :param ai_search_endpoint: Azure AI Search endpoint URL.
-    :param api_key: Azure AI Search API key.
-    :param api_version: API version to use.
     :return: JSON response of the last result or raises an HTTP error if the request fails.
     """
 
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": api_key,
-    }
-    indexer_status_url = f"{ai_search_endpoint}/indexers/{indexer_name}/search.status?api-version={api_version}"
     logging.info(f"Checking status of indexer {indexer_name}")
 
-    response = requests.get(indexer_status_url, headers=headers)
+    response = client.request("GET", f"indexers/{indexer_name}/search.status")
     if response.status_code == 200:
         status = response.json().get("status", "Unknown")
         logging.info(f"Indexer status: {status}")
@@ -50,104 +64,283 @@ def check_indexer_status(indexer_name, ai_search_endpoint, api_key, api_version)
         response.raise_for_status()
 
 
-def run_indexer(indexer_name, ai_search_endpoint, api_key, api_version):
+def run_indexer(client, indexer_name):
     """
     Triggers the specified indexer to run and logs the result.
 
+    :param client: SearchClient to use.
     :param indexer_name: Name of the indexer to run.
-    :param ai_search_endpoint: Azure AI Search endpoint URL.
-    :param api_key: Azure AI Search API key.
-    :param api_version: API version to use.
-    :return: JSON response of the run result or raises an HTTP error if the request fails.
+    :return: True if the run was started, False if the indexer was already running; raises an HTTP error if the request fails.
     """
 
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": api_key,
-    }
-    indexer_run_url = f"{ai_search_endpoint}/indexers('{indexer_name}')/search.run?api-version={api_version}"
     logging.info(f"Running indexer {indexer_name}")
 
-    response = requests.post(indexer_run_url, headers=headers)
+    response = client.request("POST", f"indexers('{indexer_name}')/search.run")
     if response.status_code == 202:
-        try:
-            result = response.json()
-            logging.info(f"Indexer run result: {json.dumps(result, indent=2)}")
-            return result
-        except json.JSONDecodeError:
-            logging.error("Failed to parse JSON response")
-            raise ValueError("Invalid JSON response")
+        # The service accepts the run without a response body.
+        logging.info(f"Indexer {indexer_name} run started")
+        return True
     elif response.status_code == 409:
         logging.info("Indexer is already running")
+        return False
     else:
         logging.error(f"Status code: {response.status_code}")
         logging.error(f"Failed to run indexer: {response.text}")
         response.raise_for_status()
 
 
-def delete_resource(resource_url, headers, resource_type):
+def watch_indexer(
+    client,
+    indexer_name,
+    output=None,
+    total_items=None,
+    min_interval=None,
+    wait_for_start=False,
+):
+    """
+    Follows the running indexer until it finishes, logging throughput and new errors.
+
+    :param client: SearchClient to use.
+    :param indexer_name: Name of the indexer to watch.
+    :param output: Optional CSV/JSON file for the time series.
+    :param total_items: Expected number of items, needed for the ETA.
+    :param min_interval: Poll interval in seconds while items are processed.
+    :param wait_for_start: True if the run was just triggered and may not show up yet.
+    :return: The issues grouped by message.
+    """
+    monitor = IndexerMonitor(
+        client, indexer_name, min_interval=min_interval or 5, total_items=total_items
+    )
+
+    def report(sample, new_issues):
+        rate = "n/a" if sample["items_per_s"] is None else f"{sample['items_per_s']}/s"
+        eta = "n/a" if sample["eta_s"] is None else f"{sample['eta_s']}s"
+        logging.info(
+            f"[{sample['status']}] processed {sample['items_processed']}, "
+            f"failed {sample['items_failed']} ({sample['failure_rate']:.2%}), "
+            f"{rate}, ETA {eta}; next poll in {monitor.interval}s"
+        )
+        for issue in new_issues:
+            log = logging.error if issue["kind"] == "error" else logging.warning
+            log(f"{issue['category']}: {issue['key']}: {issue['message']}")
+
+    try:
+        monitor.watch(report, wait_for_start=wait_for_start)
+    finally:
+        if output:
+            write_series(monitor.samples, output)
+    summary = monitor.issue_summary()
+    if summary:
+        logging.info("Errors and warnings by message:")
+        for group in summary:
+            logging.info(
+                f"  {group['count']:>6}  {group['kind']:<7} {group['category']:<22} {group['message']}"
+            )
+    return summary
+
+
+def run_indexers(
+    client, names, output=None, total_items=None, min_interval=None, start=True
+):
     """
-    Deletes the specified resource.
+    Starts several indexers (e.g. all shards) and follows them until every one finished.
 
-    :param resource_url: The URL of the resource to delete.
-    :param headers: The headers to include in the request.
-    :param resource_type: The type of resource being deleted (for logging).
+    :param client: SearchClient to use.
+    :param names: Names of the indexers.
+    :param output: Optional CSV/JSON file for the aggregated time series.
+    :param total_items: Expected number of items over all indexers, needed for the ETA.
+    :param min_interval: Poll interval in seconds while items are processed.
+    :param start: False to only follow runs that are already in progress.
+    :return: Dict of indexer name to its issues grouped by message.
     """
-    response = requests.delete(resource_url, headers=headers)
+    min_interval = min_interval or 5
+    monitors = {
+        name: IndexerMonitor(client, name, min_interval=min_interval) for name in names
+    }
+    latest = {}
+    lock = threading.Lock()
+
+    def follow(name):
+        if start:
+            run_indexer(client, name)
+
+        def record(sample, new_issues):
+            with lock:
+                latest[name] = sample
+            for issue in new_issues:
+                log = logging.error if issue["kind"] == "error" else logging.warning
+                log(f"{name}: {issue['category']}: {issue['key']}: {issue['message']}")
+
+        monitors[name].watch(record, wait_for_start=start)
+
+    series = []
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        futures = [executor.submit(follow, name) for name in names]
+        while not all(future.done() for future in futures):
+            time.sleep(min_interval)
+            with lock:
+                samples = list(latest.values())
+            if not samples:
+                continue
+            combined = aggregate_samples(samples, total_items)
+            series.append(combined)
+            eta = "n/a" if combined["eta_s"] is None else f"{combined['eta_s']}s"
+            logging.info(
+                f"[{combined['status']}] processed {combined['items_processed']}, "
+                f"failed {combined['items_failed']} ({combined['failure_rate']:.2%}), "
+                f"{combined['items_per_s']}/s, ETA {eta}"
+            )
+        for future in futures:
+            future.result()
+
+    if output:
+        write_series(series, output)
+    for name, monitor in monitors.items():
+        sample = latest.get(name)
+        if sample:
+            logging.info(
+                f"{name}: {sample['status']}, processed {sample['items_processed']}, "
+                f"failed {sample['items_failed']}"
+            )
+    return {name: monitor.issue_summary() for name, monitor in monitors.items()}
+
+
+def reset_skills(client, skill_names):
+    """
+    Marks skills as changed, so the next run reruns them (and everything downstream)
+    while the enrichment cache keeps serving the other skills.
+
+    :param client: SearchClient to use.
+    :param skill_names: Names of the skills to reset, e.g. markdown_section_split_skill.
+    """
+    logging.info(f"Resetting skills {skill_names} of {skillset_name}")
+    response = client.request(
+        "POST",
+        f"skillsets/{skillset_name}/resetskills",
+        AI_SEARCH_SKILLSET_API_VERSION,
+        json={"skillNames": skill_names},
+    )
     if response.status_code == 204:
-        logging.info(f"{resource_type} deleted successfully.")
-    elif response.status_code == 404:
-        logging.warning(f"{resource_type} not found.")
+        logging.info("Skills reset. Run the indexer to reprocess them.")
     else:
-        logging.error(
-            f"Failed to delete {resource_type}. Status code: {response.status_code}"
-        )
+        logging.error(f"Failed to reset skills. Status code: {response.status_code}")
         logging.error(f"Response: {response.text}")
+        response.raise_for_status()
 
 
-def delete_index():
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": AI_SEARCH_ADMIN_KEY,
-    }
-    index_url = f"{AI_SEARCH_ENDPOINT}/indexes/{index_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}"
-    delete_resource(index_url, headers, "Index")
+def get_function_stats():
+    """Counters of the Function App instance that answers (see the stats route)."""
+    params, headers = get_function_auth()
+    response = requests.get(
+        f"{FUNCTION_ENDPOINT}/api/stats", params=params, headers=headers, timeout=30
+    )
+    response.raise_for_status()
+    return response.json()
 
 
-def delete_indexer():
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": AI_SEARCH_ADMIN_KEY,
-    }
-    indexer_url = f"{AI_SEARCH_ENDPOINT}/indexers/{indexer_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}"
-    delete_resource(indexer_url, headers, "Indexer")
+def cache_report(client, names, min_interval=None):
+    """
+    Runs the indexers and reports how much image work reached the function.
 
+    The two sides count different things: the indexer reports documents, the
+    function's stats route counts image records (one per normalized image) and
+    only for the instance that answers it. The report therefore keeps them
+    apart instead of deriving a per-document cache hit rate. The image record
+    count covers the whole run only while a single instance, not restarted
+    during the run, serves the skill.
 
-def delete_skillset():
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": AI_SEARCH_ADMIN_KEY,
+    :param client: SearchClient to use.
+    :param names: Names of the indexers to run.
+    :param min_interval: Poll interval in seconds while items are processed.
+    :return: Dict with the documents the indexers processed, and the image records and
+        Vision calls one function instance saw during the run.
+    """
+    before = get_function_stats()
+    run_indexers(client, names, min_interval=min_interval)
+    after = get_function_stats()
+
+    documents = 0
+    for name in names:
+        response = client.request("GET", f"indexers/{name}/search.status")
+        response.raise_for_status()
+        documents += (response.json().get("lastResult") or {}).get("itemsProcessed", 0)
+    same_instance = (before["instance"], before["worker_started"]) == (
+        after["instance"],
+        after["worker_started"],
+    )
+    report = {
+        "documents_processed": documents,
+        "function_instance": after["instance"],
+        "instance_image_records": after["records_processed"]
+        - before["records_processed"],
+        "instance_vision_calls": after["vision_calls"] - before["vision_calls"],
+        "same_instance_before_and_after": same_instance,
     }
-    skillset_url = f"{AI_SEARCH_ENDPOINT}/skillsets/{skillset_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}"
-    delete_resource(skillset_url, headers, "Skillset")
 
+    logging.info(f"Documents processed by the indexers: {documents}")
+    logging.info(
+        f"Image records received by function instance {report['function_instance']}: "
+        f"{report['instance_image_records']} ({report['instance_vision_calls']} AI Vision calls)"
+    )
+    logging.warning(
+        "Image records are counted by one function instance and are not comparable "
+        "with the document count; other instances' records are missing."
+    )
+    if not same_instance:
+        logging.warning(
+            "A different or restarted function instance answered; the image record "
+            "and Vision call deltas are meaningless for this run."
+        )
+    elif report["instance_image_records"] == 0 and documents:
+        logging.info(
+            "No image record reached this instance. If it is the only instance, the "
+            "image enrichments came from the enrichment cache."
+        )
+    return report
 
-def delete_datasource():
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": AI_SEARCH_ADMIN_KEY,
-    }
-    datasource_url = f"{AI_SEARCH_ENDPOINT}/datasources/{data_source_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}"
-    delete_resource(datasource_url, headers, "Data Source")
 
+def delete_index(client):
+    return client.delete_resource(f"indexes/{index_name}", "Index")
 
-def get_skillset():
-    headers = {
-        "x-ms-client-request-id": x_ms_client_request_id,
-        "api-key": AI_SEARCH_ADMIN_KEY,
-    }
-    skillset_url = f"{AI_SEARCH_ENDPOINT}/skillsets/{skillset_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}"
-    response = requests.get(skillset_url, headers=headers)
+
+def delete_indexer(client):
+    for name in indexer_names:
+        client.delete_resource(f"indexers/{name}", f"Indexer {name}")
+
+
+def delete_skillset(client):
+    return client.delete_resource(f"skillsets/{skillset_name}", "Skillset")
+
+
+def delete_datasource(client):
+    for name in data_source_names:
+        client.delete_resource(f"datasources/{name}", f"Data Source {name}")
+
+
+def wipe_all(client):
+    """Deletes every resource of the use case, each as soon as nothing references it anymore."""
+    referenced_by = {key: [] for key in resources}
+    for key, (_, _, dependencies) in resources.items():
+        for dependency in dependencies:
+            referenced_by[dependency].append(key)
+
+    def delete_step(kind, definition):
+        return lambda: client.delete_resource(
+            f"{resource_collections[kind]}/{definition['name']}",
+            f"{resource_labels[kind]} {definition['name']}",
+        )
+
+    run_with_dependencies(
+        {
+            key: (delete_step(kind, definition), referenced_by[key])
+            for key, (kind, definition, _) in resources.items()
+        },
+        max_workers=8,
+    )
+
+
+def get_skillset(client):
+    response = client.request("GET", f"skillsets/{skillset_name}")
     if response.status_code == 200:
         skillset = response.json()
         logging.info(f"Skillset: {json.dumps(skillset, indent=2)}")
@@ -166,6 +359,37 @@ if __name__ == "__main__":
         "--status", action="store_true", help="Check the status of the indexer"
     )
     parser.add_argument("--run", action="store_true", help="Trigger the indexer to run")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Follow the indexer run with throughput, ETA and grouped errors",
+    )
+    parser.add_argument(
+        "--watch-output",
+        help="Write the --watch/--run-shards time series to this .csv or .json file",
+    )
+    parser.add_argument(
+        "--total-items",
+        type=int,
+        help="Expected number of items, for the --watch/--run-shards ETA",
+    )
+    parser.add_argument(
+        "--run-shards",
+        action="store_true",
+        help="Start every indexer (one per shard) and follow them with aggregated throughput",
+    )
+    parser.add_argument(
+        "--reset-skills",
+        help="Comma-separated skill names to rerun on the next run (enrichment cache)",
+    )
+    parser.add_argument(
+        "--cache-report",
+        action="store_true",
+        help="Run the indexers and report documents processed and the image records one function instance received",
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, help="Shortest --watch poll interval (default 5s)"
+    )
     parser.add_argument("--delete-index", action="store_true", help="Delete the index")
     parser.add_argument(
         "--delete-indexer", action="store_true", help="Delete the indexer"
@@ -181,37 +405,63 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
+    client = get_search_client()
     try:
         if args.status:
-            check_indexer_status(
-                indexer_name=indexer_name,
-                ai_search_endpoint=AI_SEARCH_ENDPOINT,
-                api_key=AI_SEARCH_ADMIN_KEY,
-                api_version=AI_SEARCH_SEARCH_API_VERSION,
+            for name in indexer_names:
+                check_indexer_status(client, name)
+        if args.reset_skills:
+            reset_skills(
+                client, [name.strip() for name in args.reset_skills.split(",")]
+            )
+        if args.cache_report:
+            cache_report(client, indexer_names, min_interval=args.poll_interval)
+        # With INDEXER_SHARD_PREFIXES, --run and --watch cover every shard indexer.
+        if len(indexer_names) > 1 and args.watch:
+            run_indexers(
+                client,
+                indexer_names,
+                output=args.watch_output,
+                total_items=args.total_items,
+                min_interval=args.poll_interval,
+                start=args.run,
             )
-        if args.run:
-            run_indexer(
-                indexer_name=indexer_name,
-                ai_search_endpoint=AI_SEARCH_ENDPOINT,
-                api_key=AI_SEARCH_ADMIN_KEY,
-                api_version=AI_SEARCH_SEARCH_API_VERSION,
+        else:
+            if args.run:
+                for name in indexer_names:
+                    run_indexer(client, name)
+            if args.watch:
+                watch_indexer(
+                    client,
+                    indexer_names[0],
+                    output=args.watch_output,
+                    total_items=args.total_items,
+                    min_interval=args.poll_interval,
+                    wait_for_start=args.run,
+                )
+        if args.run_shards:
+            run_indexers(
+                client,
+                indexer_names,
+                output=args.watch_output,
+                total_items=args.total_items,
+                min_interval=args.poll_interval,
             )
         if args.delete_index:
-            delete_index()
+            delete_index(client)
         if args.delete_indexer:
-            delete_indexer()
+            delete_indexer(client)
         if args.delete_skillset:
-            delete_skillset()
+            delete_skillset(client)
         if args.delete_datasource:
-            delete_datasource()
+            delete_datasource(client)
         if args.wipe_all:
-            delete_indexer()
-            delete_skillset()
-            delete_datasource()
-            delete_index()
+            wipe_all(client)
         if args.get_skillset:
-            get_skillset()
+            get_skillset(client)
         if not any(vars(args).values()):
             print("No action specified. Use --help for available options.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        client.close()
@@ -0,0 +1,229 @@
+import csv
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+# Issue categories, matched in order against the error or warning message.
+ISSUE_CATEGORIES = (
+    (
+        "language not supported",
+        re.compile(
+            r"NotSupportedLanguage|not supported for|not available for language", re.I
+        ),
+    ),
+    ("vision throttled", re.compile(r"throttl|\b429\b|Too Many Requests", re.I)),
+    ("timeout", re.compile(r"timed? ?out|timeout|deadline", re.I)),
+    (
+        "skill endpoint",
+        re.compile(r"Web ?Api ?Skill|Could not execute skill|\b5\d\d\b", re.I),
+    ),
+)
+
+# Weight of the newest interval in the smoothed throughput used for the ETA.
+RATE_SMOOTHING = 0.3
+
+SERIES_FIELDS = (
+    "timestamp",
+    "elapsed_s",
+    "status",
+    "items_processed",
+    "items_failed",
+    "items_per_s",
+    "failure_rate",
+    "eta_s",
+)
+
+
+def classify_issue(message):
+    for category, pattern in ISSUE_CATEGORIES:
+        if pattern.search(message or ""):
+            return category
+    return "other"
+
+
+def normalize_message(message):
+    """Drops record ids, numbers and quoted values so that similar messages group together."""
+    message = re.sub(r"'[^']*'|\"[^\"]*\"", "'…'", message or "")
+    return re.sub(r"\d+", "N", message)[:160]
+
+
+class IndexerMonitor:
+    """
+    Follows an indexer run through search.status.
+
+    Polls quickly while items are flowing and backs off while nothing changes,
+    and derives throughput, failure rate and ETA from the item counter deltas.
+    The ETA uses a smoothed rate, so a single slow interval does not swing it.
+    """
+
+    def __init__(
+        self, client, indexer_name, min_interval=5, max_interval=60, total_items=None
+    ):
+        """
+        :param client: SearchClient to use.
+        :param indexer_name: Name of the indexer to watch.
+        :param min_interval: Poll interval in seconds while items are processed.
+        :param max_interval: Longest poll interval while nothing changes.
+        :param total_items: Expected number of items, needed for the ETA.
+        """
+        self.client = client
+        self.indexer_name = indexer_name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.total_items = total_items
+        self.interval = min_interval
+        self.issues = Counter()
+        self.samples = []
+        self._seen_issues = set()
+        self._previous = None
+        self._smoothed_rate = None
+        self._started = time.monotonic()
+
+    def poll(self):
+        """
+        Fetches the status once.
+
+        :return: Tuple of the time series sample and the issues not seen before.
+        """
+        response = self.client.request(
+            "GET", f"indexers/{self.indexer_name}/search.status"
+        )
+        response.raise_for_status()
+        last_result = response.json().get("lastResult") or {}
+        now = time.monotonic()
+        processed = last_result.get("itemsProcessed", 0)
+        failed = last_result.get("itemsFailed", 0)
+
+        items_per_s = None
+        if self._previous is not None:
+            previous_time, previous_processed = self._previous
+            if processed >= previous_processed and now > previous_time:
+                items_per_s = (processed - previous_processed) / (now - previous_time)
+                self._smoothed_rate = (
+                    items_per_s
+                    if self._smoothed_rate is None
+                    else RATE_SMOOTHING * items_per_s
+                    + (1 - RATE_SMOOTHING) * self._smoothed_rate
+                )
+        self._adapt_interval(processed)
+        self._previous = (now, processed)
+
+        eta_s = None
+        if self.total_items and self._smoothed_rate:
+            eta_s = max(0, self.total_items - processed) / self._smoothed_rate
+        sample = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "elapsed_s": round(now - self._started, 1),
+            "status": last_result.get("status", "unknown"),
+            "items_processed": processed,
+            "items_failed": failed,
+            "items_per_s": None if items_per_s is None else round(items_per_s, 2),
+            "failure_rate": round(failed / processed, 4) if processed else 0.0,
+            "eta_s": None if eta_s is None else round(eta_s),
+        }
+        self.samples.append(sample)
+        return sample, self._new_issues(last_result)
+
+    def watch(self, on_sample=None, wait_for_start=False, start_polls=5):
+        """
+        Polls until the run is no longer in progress.
+
+        :param on_sample: Called with (sample, new issues) after every poll.
+        :param wait_for_start: True right after search.run, while lastResult may still show the previous run.
+        :param start_polls: Polls to wait for the run to show up before giving up.
+        :return: The last sample.
+        """
+        started = not wait_for_start
+        polls = 0
+        while True:
+            sample, new_issues = self.poll()
+            polls += 1
+            if on_sample:
+                on_sample(sample, new_issues)
+            if sample["status"] == "inProgress":
+                started = True
+            elif started or polls >= start_polls:
+                return sample
+            time.sleep(self.interval)
+
+    def _adapt_interval(self, processed):
+        if self._previous is not None and processed == self._previous[1]:
+            self.interval = min(self.max_interval, self.interval * 2)
+        else:
+            self.interval = self.min_interval
+
+    def _new_issues(self, last_result):
+        new_issues = []
+        for kind, items, field in (
+            ("error", last_result.get("errors") or [], "errorMessage"),
+            ("warning", last_result.get("warnings") or [], "message"),
+        ):
+            for item in items:
+                message = item.get(field) or ""
+                identity = (kind, item.get("key"), message)
+                if identity in self._seen_issues:
+                    continue
+                self._seen_issues.add(identity)
+                group = (kind, classify_issue(message), normalize_message(message))
+                self.issues[group] += 1
+                new_issues.append(
+                    {
+                        "kind": kind,
+                        "category": group[1],
+                        "key": item.get("key"),
+                        "message": message,
+                    }
+                )
+        return new_issues
+
+    def issue_summary(self):
+        """Issues seen so far, grouped by kind, category and normalized message, most frequent first."""
+        return [
+            {"kind": kind, "category": category, "message": message, "count": count}
+            for (kind, category, message), count in self.issues.most_common()
+        ]
+
+
+def aggregate_samples(samples, total_items=None):
+    """
+    Combines the latest samples of several indexers (e.g. the shards of one index).
+
+    :param samples: The latest sample of each indexer.
+    :param total_items: Expected number of items over all indexers, needed for the ETA.
+    :return: One sample with the summed counters and throughput.
+    """
+    processed = sum(sample["items_processed"] for sample in samples)
+    failed = sum(sample["items_failed"] for sample in samples)
+    items_per_s = sum(
+        sample["items_per_s"] or 0
+        for sample in samples
+        if sample["status"] == "inProgress"
+    )
+    running = sum(1 for sample in samples if sample["status"] == "inProgress")
+    eta_s = None
+    if total_items and items_per_s:
+        eta_s = round(max(0, total_items - processed) / items_per_s)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "elapsed_s": max((sample["elapsed_s"] for sample in samples), default=0),
+        "status": f"{running}/{len(samples)} inProgress",
+        "items_processed": processed,
+        "items_failed": failed,
+        "items_per_s": round(items_per_s, 2),
+        "failure_rate": round(failed / processed, 4) if processed else 0.0,
+        "eta_s": eta_s,
+    }
+
+
+def write_series(samples, path):
+    """Writes the time series as CSV, or as JSON if path ends with .json."""
+    with open(path, "w", newline="") as output_file:
+        if path.lower().endswith(".json"):
+            json.dump(samples, output_file, indent=2)
+        else:
+            writer = csv.DictWriter(output_file, fieldnames=SERIES_FIELDS)
+            writer.writeheader()
+            writer.writerows(samples)
+    logging.info(f"Time series written to {path}")
@@ -0,0 +1,292 @@
+import argparse
+import csv
+import importlib.util
+import json
+import logging
+import os
+import re
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+
+logging.basicConfig(level=logging.INFO)
+
+# Used when tiktoken is not installed; close to cl100k_base on English prose.
+CHARS_PER_TOKEN = 4
+
+RESULT_FIELDS = (
+    "id",
+    "content_chars",
+    "images",
+    "merged_chars",
+    "chunks",
+    "overlap_chars",
+    "tokens",
+    "overlap_tokens",
+)
+
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]?\s")
+
+_encoding = None
+
+
+def skill_parameters(skillset):
+    """
+    Reads the merge and split settings the simulator has to match from a skillset definition.
+
+    :param skillset: Skillset definition, e.g. definitions.skillset_definition.
+    :return: Dict of simulator settings.
+    """
+    settings = {}
+    for skill in skillset["skills"]:
+        skill_type = skill["@odata.type"]
+        if skill_type.endswith("MergeSkill"):
+            settings["pre_tag"] = skill.get("insertPreTag", " ")
+            settings["post_tag"] = skill.get("insertPostTag", " ")
+        elif skill_type.endswith("SplitSkill"):
+            settings["max_page_length"] = skill.get("maximumPageLength", 2000)
+            settings["page_overlap"] = skill.get("pageOverlapLength", 0)
+    return settings
+
+
+def merge_text(content, image_texts, offsets=None, pre_tag=" ", post_tag=" "):
+    """
+    MergeSkill: inserts the image texts into the content at their offsets.
+
+    Without offsets the texts are appended, as the skill does.
+    """
+    if not offsets:
+        return content + "".join(f"{pre_tag}{text}{post_tag}" for text in image_texts)
+    parts = []
+    position = 0
+    for offset, text in sorted(zip(offsets, image_texts), key=lambda item: item[0]):
+        offset = min(max(offset, position), len(content))
+        parts.append(content[position:offset])
+        parts.append(f"{pre_tag}{text}{post_tag}")
+        position = offset
+    parts.append(content[position:])
+    return "".join(parts)
+
+
+def split_pages(text, max_page_length=2000, page_overlap=0):
+    """
+    SplitSkill in pages mode, measured in characters.
+
+    A page ends at the last sentence end, or else the last whitespace, within
+    max_page_length; the next page repeats the last page_overlap characters,
+    starting at a word boundary. This approximates the service's splitter
+    closely enough for sizing, not for byte-identical chunks.
+
+    :return: List of (page, overlap characters shared with the previous page).
+    """
+    pages = []
+    start = 0
+    overlap = 0
+    while start < len(text):
+        end = min(start + max_page_length, len(text))
+        if end < len(text):
+            window = text[start:end]
+            boundaries = [match.end() for match in _SENTENCE_END.finditer(window)]
+            cut = boundaries[-1] if boundaries else window.rfind(" ") + 1
+            # Do not shrink a page below half its length for a nicer boundary.
+            if cut > max_page_length // 2:
+                end = start + cut
+        page = text[start:end]
+        if page.strip():
+            pages.append((page, overlap))
+        if end >= len(text):
+            break
+        next_start = max(end - page_overlap, start + 1)
+        if page_overlap:
+            space = text.find(" ", next_start, end)
+            if space != -1:
+                next_start = space + 1
+        overlap = end - next_start
+        start = next_start
+    return pages
+
+
+def count_tokens(text):
+    global _encoding
+
+    if _encoding is None and importlib.util.find_spec("tiktoken") is not None:
+        import tiktoken
+
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def simulate_document(document, settings):
+    """
+    Runs one document through merge and split.
+
+    :param document: Dict with id, content and images ([{"image_text", "contentOffset"}]).
+    :param settings: Result of skill_parameters, possibly overridden.
+    :return: Result row, see RESULT_FIELDS.
+    """
+    content = document.get("content") or ""
+    images = document.get("images") or []
+    image_texts = [image.get("image_text") or "" for image in images]
+    offsets = [image.get("contentOffset") for image in images]
+    merged = merge_text(
+        content,
+        image_texts,
+        offsets if images and None not in offsets else None,
+        settings["pre_tag"],
+        settings["post_tag"],
+    )
+    pages = split_pages(merged, settings["max_page_length"], settings["page_overlap"])
+    return {
+        "id": document.get("id"),
+        "content_chars": len(content),
+        "images": len(images),
+        "merged_chars": len(merged),
+        "chunks": len(pages),
+        "overlap_chars": sum(overlap for _, overlap in pages),
+        "tokens": sum(count_tokens(page) for page, _ in pages),
+        "overlap_tokens": sum(count_tokens(page[:overlap]) for page, overlap in pages),
+    }
+
+
+def read_documents(path):
+    """
+    Streams the documents to simulate.
+
+    A .jsonl file holds one document per line: {"id", "content", "images":
+    [{"image_text", "contentOffset"}]}, e.g. the document text plus the
+    function's image_text per image. A directory is read as plain text files
+    without images.
+    """
+    if os.path.isdir(path):
+        for root, _, names in os.walk(path):
+            for name in sorted(names):
+                file_path = os.path.join(root, name)
+                with open(file_path, encoding="utf-8", errors="replace") as text_file:
+                    yield {
+                        "id": os.path.relpath(file_path, path),
+                        "content": text_file.read(),
+                    }
+        return
+    with open(path, encoding="utf-8") as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, 1):
+            if line.strip():
+                document = json.loads(line)
+                document.setdefault("id", str(line_number))
+                yield document
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+def summarize(rows, elapsed, price_per_1k_tokens=None):
+    chunks = [row["chunks"] for row in rows]
+    tokens = sum(row["tokens"] for row in rows)
+    overlap_tokens = sum(row["overlap_tokens"] for row in rows)
+    summary = {
+        "documents": len(rows),
+        "chunks": sum(chunks),
+        "embedding_calls": sum(chunks),
+        "chunks_per_document_p50": percentile(chunks, 50),
+        "chunks_per_document_p95": percentile(chunks, 95),
+        "chunks_per_document_max": max(chunks, default=None),
+        "tokens": tokens,
+        "overlap_tokens": overlap_tokens,
+        "overlap_waste": round(overlap_tokens / tokens, 4) if tokens else 0.0,
+        "tokenizer": (
+            "cl100k_base" if _encoding is not None else f"{CHARS_PER_TOKEN} chars/token"
+        ),
+        "elapsed_s": round(elapsed, 2),
+    }
+    if price_per_1k_tokens is not None:
+        summary["estimated_cost"] = round(tokens / 1000 * price_per_1k_tokens, 4)
+    return summary
+
+
+def default_settings():
+    """The merge and split settings of definitions.skillset_definition."""
+    from definitions import skillset_definition
+
+    return skill_parameters(skillset_definition)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate chunks and embedding tokens of a corpus without running the indexer"
+    )
+    parser.add_argument("input", help="Documents as .jsonl, or a directory of text files")
+    parser.add_argument(
+        "--max-page-length", type=int, help="Override the SplitSkill maximumPageLength"
+    )
+    parser.add_argument(
+        "--page-overlap", type=int, help="Override the SplitSkill pageOverlapLength"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Worker processes"
+    )
+    parser.add_argument("--output", help="Write one row per document (.csv or .jsonl)")
+    parser.add_argument(
+        "--price-per-1k-tokens", type=float, help="Embedding price, for a cost estimate"
+    )
+    args = parser.parse_args()
+
+    try:
+        settings = default_settings()
+    except Exception as e:
+        # definitions.py needs the .env of a deployment; the skill defaults work without it.
+        logging.warning(f"Using default skill settings, definitions.py failed to load: {e}")
+        settings = {}
+    settings = {
+        "pre_tag": " ",
+        "post_tag": " ",
+        "max_page_length": 2000,
+        "page_overlap": 500,
+        **settings,
+    }
+    if args.max_page_length is not None:
+        settings["max_page_length"] = args.max_page_length
+    if args.page_overlap is not None:
+        settings["page_overlap"] = args.page_overlap
+    if settings["page_overlap"] >= settings["max_page_length"]:
+        parser.error("The page overlap must be shorter than the page length")
+    logging.info(f"Simulating with {settings}")
+
+    rows = []
+    output_file = open(args.output, "w", newline="") if args.output else None
+    writer = None
+    if output_file and not args.output.lower().endswith(".jsonl"):
+        writer = csv.DictWriter(output_file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+
+    started = time.perf_counter()
+    # Documents are read lazily and results written as they arrive; only three
+    # counters per document stay in memory for the summary.
+    with Pool(args.workers) as pool:
+        for row in pool.imap_unordered(
+            partial(simulate_document, settings=settings),
+            read_documents(args.input),
+            chunksize=16,
+        ):
+            rows.append({key: row[key] for key in ("chunks", "tokens", "overlap_tokens")})
+            if writer:
+                writer.writerow(row)
+            elif output_file:
+                output_file.write(json.dumps(row) + "\n")
+            if len(rows) % 10000 == 0:
+                logging.info(f"{len(rows)} documents simulated")
+    if output_file:
+        output_file.close()
+
+    count_tokens("")  # report the tokenizer the workers used
+    json.dump(
+        summarize(rows, time.perf_counter() - started, args.price_per_1k_tokens),
+        sys.stdout,
+        indent=2,
+    )
+    print()
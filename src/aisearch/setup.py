@@ -1,45 +1,60 @@
-from azure_search_client import create_resource
+from azure_search_client import SearchClient, run_with_dependencies
 from config import (
     AI_SEARCH_ADMIN_KEY,
     AI_SEARCH_ENDPOINT,
     AI_SEARCH_SEARCH_API_VERSION,
     AI_SEARCH_SKILLSET_API_VERSION,
+    ENRICHMENT_CACHE,
 )
 from definitions import (
-    data_source_name,
-    datasource_definition,
-    index_definition,
-    index_name,
-    indexer_definition,
-    indexer_name,
-    skillset_definition,
-    skillset_name,
+    resource_collections,
+    resource_labels,
+    resources,
     x_ms_client_request_id,
 )
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-headers = {
-    "x-ms-client-request-id": x_ms_client_request_id,
-    "api-key": AI_SEARCH_ADMIN_KEY,
-}
 
+def api_version_for(kind):
+    # The indexer cache is only part of the preview API.
+    if kind == "skillset" or (kind == "indexer" and ENRICHMENT_CACHE):
+        return AI_SEARCH_SKILLSET_API_VERSION
+    return AI_SEARCH_SEARCH_API_VERSION
 
-def main():
-    resource_urls = {
-        "datasource": f"{AI_SEARCH_ENDPOINT}/datasources/{data_source_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}",
-        "index": f"{AI_SEARCH_ENDPOINT}/indexes/{index_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}",
-        "skillset": f"{AI_SEARCH_ENDPOINT}/skillsets/{skillset_name}?api-version={AI_SEARCH_SKILLSET_API_VERSION}",
-        "indexer": f"{AI_SEARCH_ENDPOINT}/indexers/{indexer_name}?api-version={AI_SEARCH_SEARCH_API_VERSION}",
-    }
 
-    create_resource(
-        resource_urls["datasource"], headers, datasource_definition, "Data Source"
+def create_step(client, kind, definition):
+    def step():
+        response = client.create_resource(
+            f"{resource_collections[kind]}/{definition['name']}",
+            definition,
+            resource_labels[kind],
+            api_version_for(kind),
+        )
+        response.raise_for_status()
+        return response
+
+    return step
+
+
+def main():
+    client = SearchClient(
+        AI_SEARCH_ENDPOINT,
+        AI_SEARCH_ADMIN_KEY,
+        AI_SEARCH_SEARCH_API_VERSION,
+        client_request_id=x_ms_client_request_id,
     )
-    create_resource(resource_urls["index"], headers, index_definition, "Index")
-    create_resource(resource_urls["skillset"], headers, skillset_definition, "Skillset")
-    create_resource(resource_urls["indexer"], headers, indexer_definition, "Indexer")
+    # Independent resources (including all shard data sources) are created in
+    # parallel, dependent ones once their dependencies exist.
+    steps = {
+        key: (create_step(client, kind, definition), dependencies)
+        for key, (kind, definition, dependencies) in resources.items()
+    }
+    try:
+        run_with_dependencies(steps, max_workers=8)
+    finally:
+        client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    FUNCTION_ENDPOINT,
+    SKILL_TIMEOUT_SECONDS,
+    SKILL_TUNING_FILE,
+    get_function_auth,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+# Limits of the Custom Web API skill.
+MIN_DEGREE_OF_PARALLELISM = 1
+MAX_DEGREE_OF_PARALLELISM = 10
+MAX_BATCH_SIZE = 1000
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+
+def load_images(image_dir):
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(image_dir, name), "rb") as image:
+                images.append(base64.b64encode(image.read()).decode("utf-8"))
+    if not images:
+        raise ValueError(f"No images found in {image_dir}")
+    return images
+
+
+def measure_point(uri, params, headers, images, batch_size, dop, request_count, timeout):
+    """
+    Sends request_count batches of batch_size records with dop requests in flight.
+
+    :return: Dict with throughput and error rate of this sweep point.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=dop)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    image_cycle = itertools.cycle(images)
+    payloads = [
+        {
+            "values": [
+                {"recordId": f"{n}-{i}", "data": {"image": next(image_cycle)}}
+                for i in range(batch_size)
+            ]
+        }
+        for n in range(request_count)
+    ]
+
+    def send(payload):
+        try:
+            response = session.post(
+                uri, json=payload, params=params, headers=headers, timeout=timeout
+            )
+        except requests.exceptions.RequestException:
+            return batch_size
+        if response.status_code != 200:
+            return batch_size
+        try:
+            values = response.json().get("values", [])
+        except ValueError:
+            # A proxy or error page answering 200; count the batch as failed.
+            return batch_size
+        return sum(1 for value in values if value.get("errors"))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=dop) as executor:
+        failed = sum(executor.map(send, payloads))
+    elapsed = time.perf_counter() - started
+    session.close()
+
+    records = batch_size * request_count
+    return {
+        "batchSize": batch_size,
+        "degreeOfParallelism": dop,
+        "records_per_s": round((records - failed) / elapsed, 2),
+        "error_rate": round(failed / records, 4),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def choose_best(results, max_error_rate):
+    """Highest successful throughput among the points within the error budget."""
+    eligible = [row for row in results if row["error_rate"] <= max_error_rate]
+    if not eligible:
+        return None
+    # On ties prefer fewer parallel calls and smaller batches (less pressure on Vision).
+    return max(
+        eligible,
+        key=lambda row: (
+            row["records_per_s"],
+            -row["degreeOfParallelism"],
+            -row["batchSize"],
+        ),
+    )
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep batchSize and degreeOfParallelism of the image analysis skill"
+    )
+    parser.add_argument(
+        "--endpoint",
+        default=FUNCTION_ENDPOINT,
+        help="Function App base URL, e.g. http://localhost:7071 for a local stand-in",
+    )
+    parser.add_argument(
+        "--images",
+        default=os.path.join(os.path.dirname(__file__), "..", "test", "function"),
+        help="Directory of sample images",
+    )
+    parser.add_argument("--batch-sizes", type=parse_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--dop", type=parse_list, default=[1, 2, 5, 8, 10])
+    parser.add_argument(
+        "--requests", type=int, default=20, help="Requests per sweep point"
+    )
+    parser.add_argument(
+        "--max-error-rate",
+        type=float,
+        default=0.01,
+        help="Points with a higher record error rate are not eligible, and higher "
+        "degreeOfParallelism values of their batchSize are skipped",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=SKILL_TIMEOUT_SECONDS,
+        help="Request timeout; match the skill's timeout",
+    )
+    parser.add_argument("--use-caption", action="store_true")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Report the best values without saving"
+    )
+    args = parser.parse_args()
+
+    invalid_dop = [
+        dop
+        for dop in args.dop
+        if not MIN_DEGREE_OF_PARALLELISM <= dop <= MAX_DEGREE_OF_PARALLELISM
+    ]
+    if invalid_dop:
+        parser.error(
+            f"degreeOfParallelism must be between {MIN_DEGREE_OF_PARALLELISM} and "
+            f"{MAX_DEGREE_OF_PARALLELISM}, got {invalid_dop}"
+        )
+    if any(not 1 <= size <= MAX_BATCH_SIZE for size in args.batch_sizes):
+        parser.error(f"batchSize must be between 1 and {MAX_BATCH_SIZE}")
+
+    params, headers = get_function_auth()
+    params["use_caption"] = "true" if args.use_caption else "false"
+    params["deadline_seconds"] = str(args.timeout)
+    uri = f"{args.endpoint}/api/aivisionapiv4"
+    images = load_images(args.images)
+
+    results = []
+    for batch_size in args.batch_sizes:
+        for dop in sorted(args.dop):
+            row = measure_point(
+                uri, params, headers, images, batch_size, dop, args.requests, args.timeout
+            )
+            results.append(row)
+            logging.info(
+                f"batchSize={batch_size} degreeOfParallelism={dop}: "
+                f"{row['records_per_s']} records/s, error rate {row['error_rate']:.2%}"
+            )
+            if row["error_rate"] > args.max_error_rate:
+                # More parallelism only makes a 429 storm worse.
+                logging.info(f"Skipping higher degreeOfParallelism for batchSize={batch_size}")
+                break
+
+    best = choose_best(results, args.max_error_rate)
+    if best is None:
+        logging.error("No sweep point stayed within the error budget; nothing written.")
+    elif args.dry_run:
+        logging.info(f"Best values (not saved): {json.dumps(best)}")
+    else:
+        with open(SKILL_TUNING_FILE, "w") as tuning_file:
+            json.dump({**best, "sweep": results}, tuning_file, indent=2)
+        logging.info(
+            f"Saved batchSize={best['batchSize']} degreeOfParallelism={best['degreeOfParallelism']} "
+            f"to {SKILL_TUNING_FILE}. Run setup.py to push the skillset."
+        )
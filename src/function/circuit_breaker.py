@@ -0,0 +1,172 @@
+import logging
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling AI Vision while the circuit is open."""
+
+
+def is_failure(error):
+    """True if an analyze error points at a degraded service rather than at the request."""
+    if isinstance(error, TimeoutError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        # Connection and transport errors carry no status code.
+        return type(error).__module__.startswith("azure.core")
+    return status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Stops calling AI Vision while it is failing or too slow.
+
+    Calls are tracked in a rolling time window. The circuit opens when enough
+    calls failed or were slow, fails fast while open, and after open_seconds
+    lets a few probe calls through (half-open). It closes once all probes
+    succeeded and opens again on the first failed probe.
+    """
+
+    def __init__(
+        self,
+        window_seconds=30,
+        min_calls=10,
+        error_rate=0.5,
+        slow_call_seconds=10,
+        slow_call_rate=0.8,
+        open_seconds=30,
+        half_open_probes=3,
+    ):
+        """
+        :param window_seconds: Length of the rolling window.
+        :param min_calls: Calls needed in the window before the circuit can open.
+        :param error_rate: Share of failed calls that opens the circuit.
+        :param slow_call_seconds: Calls slower than this count as slow.
+        :param slow_call_rate: Share of slow calls that opens the circuit.
+        :param open_seconds: Time the circuit stays open before probing.
+        :param half_open_probes: Successful probes needed to close the circuit.
+        """
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._calls = deque()  # (time, failed, latency)
+        self._probes_started = 0
+        self._probes_succeeded = 0
+
+    def raise_if_open(self):
+        """Fails fast while the circuit is open and not yet due for probing."""
+        if self.state == OPEN and time.monotonic() - self.opened_at < self.open_seconds:
+            self.rejected += 1
+            raise CircuitOpenError(
+                "AI Vision is failing, calls are paused (circuit open); retry later."
+            )
+
+    def acquire(self):
+        """
+        Admits one call.
+
+        :return: True if the call is a half-open probe.
+        :raises CircuitOpenError: While open, or when every probe slot is taken.
+        """
+        self.raise_if_open()
+        if self.state == OPEN:
+            self._transition(HALF_OPEN)
+            self._probes_started = 0
+            self._probes_succeeded = 0
+        if self.state == HALF_OPEN:
+            if self._probes_started >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    "AI Vision is being probed after failures (circuit half-open); retry later."
+                )
+            self._probes_started += 1
+            return True
+        return False
+
+    def record(self, failed, latency, probe=False):
+        """
+        Records the outcome of an admitted call.
+
+        :param failed: True if the call failed in a way is_failure() counts.
+        :param latency: Duration of the call in seconds.
+        :param probe: The value acquire() returned for the call.
+        """
+        if probe:
+            if self.state != HALF_OPEN:
+                return
+            if failed:
+                self._open()
+            else:
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self.half_open_probes:
+                    self._calls.clear()
+                    self._transition(CLOSED)
+            return
+
+        now = time.monotonic()
+        self._calls.append((now, failed, latency))
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+        if self.state != CLOSED or len(self._calls) < self.min_calls:
+            return
+        failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+        slow = sum(
+            1 for _, _, call_latency in self._calls if call_latency > self.slow_call_seconds
+        )
+        if (
+            failures / len(self._calls) >= self.error_rate
+            or slow / len(self._calls) >= self.slow_call_rate
+        ):
+            self._open()
+
+    def release(self, probe):
+        """Forgets an admitted call that was cancelled before it had an outcome."""
+        if probe and self.state == HALF_OPEN:
+            self._probes_started -= 1
+
+    def stats(self):
+        calls = len(self._calls)
+        latencies = sorted(latency for _, _, latency in self._calls)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_error_rate": (
+                round(sum(1 for _, failed, _ in self._calls if failed) / calls, 4)
+                if calls
+                else 0.0
+            ),
+            "window_p95_latency_s": (
+                round(latencies[min(calls - 1, round(0.95 * (calls - 1)))], 3)
+                if calls
+                else None
+            ),
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected,
+            "open_for_s": (
+                round(time.monotonic() - self.opened_at, 1) if self.state == OPEN else None
+            ),
+        }
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        if state != self.state:
+            log = logging.warning if state == OPEN else logging.info
+            log(f"AI Vision circuit {self.state} -> {state}.")
+            self.state = state
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+
+
+class RefreshingTokenCredential:
+    """
+    Async credential wrapper that refreshes tokens before they expire.
+
+    The first token per scope set is acquired inline. After that a background
+    task fetches a new token `refresh_margin` seconds before expiry, so no
+    request ever waits on the identity endpoint for a routine refresh.
+    """
+
+    def __init__(self, credential, refresh_margin=600, retry_interval=30):
+        """
+        :param credential: The wrapped async credential (e.g. ManagedIdentityCredential).
+        :param refresh_margin: Seconds before expiry at which the token is refreshed.
+        :param retry_interval: Seconds to wait before retrying a failed background refresh.
+        """
+        self._credential = credential
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._tokens = {}
+        self._acquired_at = {}
+        self._refresh_tasks = {}
+        self._locks = {}
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.last_refresh_latency = None
+
+    async def get_token(self, *scopes, **kwargs):
+        token = self._tokens.get(scopes)
+        if token is not None and token.expires_on - time.time() > 30:
+            return token
+        return await self._refresh(scopes, **kwargs)
+
+    async def close(self):
+        for task in self._refresh_tasks.values():
+            task.cancel()
+        await self._credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def metrics(self):
+        """Token age and refresh statistics, per scope set."""
+        now = time.time()
+        return {
+            "tokens": {
+                " ".join(scopes): {
+                    "age_seconds": round(now - self._acquired_at[scopes], 1),
+                    "expires_in_seconds": round(token.expires_on - now, 1),
+                }
+                for scopes, token in self._tokens.items()
+            },
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "last_refresh_latency_ms": (
+                round(self.last_refresh_latency * 1000, 1)
+                if self.last_refresh_latency is not None
+                else None
+            ),
+        }
+
+    async def _refresh(self, scopes, **kwargs):
+        stale_token = self._tokens.get(scopes)
+        lock = self._locks.setdefault(scopes, asyncio.Lock())
+        async with lock:
+            token = self._tokens.get(scopes)
+            if token is not stale_token:
+                # Another caller refreshed while we were waiting for the lock.
+                return token
+            started = time.perf_counter()
+            try:
+                token = await self._credential.get_token(*scopes, **kwargs)
+            except Exception:
+                self.refresh_failures += 1
+                raise
+            self.last_refresh_latency = time.perf_counter() - started
+            self.refreshes += 1
+            self._tokens[scopes] = token
+            self._acquired_at[scopes] = time.time()
+            logging.info(
+                f"Token refreshed in {self.last_refresh_latency * 1000:.0f}ms, "
+                f"valid for {token.expires_on - time.time():.0f}s."
+            )
+            # Short-lived tokens are refreshed at half their lifetime instead.
+            lifetime = token.expires_on - time.time()
+            self._schedule_refresh(
+                scopes, token.expires_on - min(self.refresh_margin, lifetime / 2)
+            )
+            return token
+
+    def _schedule_refresh(self, scopes, refresh_at):
+        task = self._refresh_tasks.get(scopes)
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+        self._refresh_tasks[scopes] = asyncio.get_running_loop().create_task(
+            self._refresh_later(scopes, refresh_at)
+        )
+
+    async def _refresh_later(self, scopes, refresh_at):
+        while True:
+            await asyncio.sleep(max(0.0, refresh_at - time.time()))
+            try:
+                await self._refresh(scopes)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Background token refresh failed: {e}")
+                refresh_at = time.time() + self.retry_interval
@@ -0,0 +1,144 @@
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+READ = "read"
+CAPTION = "caption"
+
+# Call strategies for a record.
+COMBINED = "combined"  # one analyze call with READ and CAPTION
+SPLIT = "split"  # READ and CAPTION as two parallel calls, so a CAPTION failure keeps the OCR
+
+# What the capability table knows about a (language, feature) pair.
+SUPPORTED = "supported"
+UNSUPPORTED = "unsupported"
+FALLBACK = "fallback"  # unsupported, but served in the fallback language
+
+# One analyze call: the features to request and the language to send.
+VisionCall = namedtuple("VisionCall", ["features", "language"])
+
+
+def is_not_supported_language(error):
+    """True if an AI Vision error says the language is not supported for a feature."""
+    if "NotSupportedLanguage" in str(error):
+        return True
+    detail = getattr(error, "error", None)
+    return bool(detail) and getattr(detail, "code", None) == "NotSupportedLanguage"
+
+
+class FeaturePlanner:
+    """
+    Chooses how to call AI Vision for a language, based on what the service told us.
+
+    The capability table maps (language, feature) to SUPPORTED, UNSUPPORTED or
+    FALLBACK and is learned from successful calls and NotSupportedLanguage
+    responses, so a combination that failed once does not reach the service
+    again until its entry expires. The table is bounded; the least recently
+    used entries are dropped first.
+    """
+
+    def __init__(
+        self,
+        strategy="auto",
+        caption_languages=("en",),
+        fallback_language=None,
+        max_entries=1024,
+        ttl_seconds=3600,
+    ):
+        """
+        :param strategy: "auto" to plan per language, or COMBINED/SPLIT to always use one strategy.
+        :param caption_languages: Languages known to support CAPTION up front; never expire.
+        :param fallback_language: Language sent instead of an unsupported one; None returns a warning.
+        :param max_entries: Maximum number of learned (language, feature) entries.
+        :param ttl_seconds: How long a learned entry is trusted before the service is asked again.
+        """
+        self.strategy = strategy
+        self.fallback_language = fallback_language
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._configured = {(language, CAPTION) for language in caption_languages}
+        self._entries = OrderedDict()
+        self.avoided_calls = 0
+
+    def status(self, language, feature):
+        """
+        Looks up a (language, feature) pair.
+
+        :return: Tuple of the known state (None if unknown) and the language to send, or None to skip the feature.
+        """
+        key = (language, feature)
+        if key in self._configured:
+            return SUPPORTED, language
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, language
+        state, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None, language
+        self._entries.move_to_end(key)
+        if state == SUPPORTED:
+            return state, language
+        if state == FALLBACK and self.status(self.fallback_language, feature)[1]:
+            return state, self.fallback_language
+        return UNSUPPORTED, None
+
+    def plan(self, language, features, replan=False):
+        """
+        Plans the analyze calls for one record.
+
+        :param language: The record's language code.
+        :param features: The requested features (READ and optionally CAPTION).
+        :param replan: True when planning again after a rejection; not counted as avoided calls.
+        :return: Tuple of the VisionCalls to make and the features that cannot be served.
+        """
+        known = {}
+        languages = {}
+        unavailable = []
+        for feature in features:
+            known[feature], languages[feature] = self.status(language, feature)
+            if languages[feature] is None:
+                unavailable.append(feature)
+                self.avoided_calls += not replan
+        requested = [feature for feature in features if feature not in unavailable]
+
+        if len(requested) == 2:
+            same_language = languages[READ] == languages[CAPTION]
+            if self.strategy == COMBINED and same_language:
+                return [VisionCall((READ, CAPTION), languages[READ])], unavailable
+            # Unknown languages are split so that a CAPTION rejection cannot cost the OCR.
+            if self.strategy != SPLIT and same_language and known[CAPTION] == SUPPORTED:
+                return [VisionCall((READ, CAPTION), languages[READ])], unavailable
+        return [
+            VisionCall((feature,), languages[feature]) for feature in requested
+        ], unavailable
+
+    def learn(self, language, feature, supported):
+        """Records whether AI Vision accepted feature for language."""
+        key = (language, feature)
+        if key in self._configured:
+            if supported:
+                return
+            self._configured.discard(key)
+        if supported:
+            state = SUPPORTED
+        elif self.fallback_language and self.fallback_language != language:
+            state = FALLBACK
+        else:
+            state = UNSUPPORTED
+        previous = self._entries.pop(key, (None, 0))[0]
+        if previous != state:
+            logging.info(f"AI Vision {feature} is {state} for language '{language}'.")
+        self._entries[key] = (state, time.monotonic() + self.ttl_seconds)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def capabilities(self):
+        table = {f"{language}/{feature}": SUPPORTED for language, feature in self._configured}
+        table.update(
+            {
+                f"{language}/{feature}": state
+                for (language, feature), (state, _) in self._entries.items()
+            }
+        )
+        return {"capabilities": table, "avoided_calls": self.avoided_calls}
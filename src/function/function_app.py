@@ -1,233 +1,978 @@
+import asyncio
+import importlib
 import json
 import logging
 import os
-import base64
+import threading
+import time
 
+module_load_started = time.perf_counter()
+
+# Only what routing needs is imported here. The AI Vision, identity and HTTP
+# libraries are imported on first use (or by the background warm-up) so the
+# worker can index the function app as early as possible after a cold start.
 import azure.functions as func
-from azure.ai.vision.imageanalysis import ImageAnalysisClient
-from azure.ai.vision.imageanalysis.models import VisualFeatures
-from azure.core.exceptions import AzureError, HttpResponseError
-from azure.identity import ManagedIdentityCredential
+import circuit_breaker
+import feature_planner as feature_planner_module
+import image_filter
+import image_preprocessing
+import ocr_layout
+from credentials import RefreshingTokenCredential
+from instrumentation import SamplingProfiler, Spans, log_snapshot
+from result_cache import ResultCache, SqliteCacheTier, make_cache_key
+from single_flight import SingleFlight
+from skill_payload import decode_image, load_record, split_records
+from throttling import AdaptiveRateLimiter, VisionThrottledError, call_with_retry
 
 app = func.FunctionApp()
 
 AI_VISION_ENDPOINT = os.getenv("AI_VISION_ENDPOINT")
+# Upper bound on the number of records of one batch analyzed concurrently.
+MAX_CONCURRENT_RECORDS = int(os.getenv("MAX_CONCURRENT_RECORDS", "4"))
+# Entries kept in the in-process result cache (0 disables the in-process tier).
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+# Optional SQLite file used as the shared result cache tier.
+RESULT_CACHE_SQLITE_PATH = os.getenv("RESULT_CACHE_SQLITE_PATH")
+# Optional downscaling/re-encoding of images above the pixel or byte budget (needs Pillow).
+IMAGE_PREPROCESSING = os.getenv("IMAGE_PREPROCESSING", "false").lower() == "true"
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "4000000"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(4 * 1024 * 1024)))
+# Optional pre-filter that skips tiny, blank and near-duplicate images (needs Pillow).
+IMAGE_FILTER = os.getenv("IMAGE_FILTER", "false").lower() == "true"
+IMAGE_FILTER_MIN_SIDE = int(os.getenv("IMAGE_FILTER_MIN_SIDE", "50"))
+IMAGE_FILTER_MIN_CONTRAST = int(os.getenv("IMAGE_FILTER_MIN_CONTRAST", "32"))
+IMAGE_FILTER_WINDOW_SIZE = int(os.getenv("IMAGE_FILTER_WINDOW_SIZE", "256"))
+# "flat" returns image_text only; "structured" adds lines/words with boxes and confidences.
+OCR_OUTPUT = os.getenv("OCR_OUTPUT", "flat").lower()
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "0"))
+# Upper bound of words in the structured output, keeping the skill response bounded.
+OCR_MAX_WORDS = int(os.getenv("OCR_MAX_WORDS", "5000"))
+# "auto" picks combined, split or READ-only calls per language; "combined" or "split" forces one.
+VISION_FEATURE_STRATEGY = os.getenv("VISION_FEATURE_STRATEGY", "auto").lower()
+# Languages known to support CAPTION before anything has been learned from the service.
+CAPTION_LANGUAGES = [
+    language.strip().lower()
+    for language in os.getenv("CAPTION_LANGUAGES", "en").split(",")
+    if language.strip()
+]
+# Language sent instead of one AI Vision rejected; empty returns a warning instead.
+VISION_FALLBACK_LANGUAGE = os.getenv("VISION_FALLBACK_LANGUAGE", "").strip().lower() or None
+# Learned language support is re-checked with the service after this long; cached
+# results degraded by a fallback or an unavailable feature expire after it as well.
+LANGUAGE_CAPABILITY_TTL_SECONDS = float(os.getenv("LANGUAGE_CAPABILITY_TTL_SECONDS", "3600"))
+LANGUAGE_CAPABILITY_MAX_ENTRIES = int(os.getenv("LANGUAGE_CAPABILITY_MAX_ENTRIES", "1024"))
+# Provisioned AI Vision transactions per second; the client-side limiter never exceeds it.
+VISION_MAX_TPS = float(os.getenv("VISION_MAX_TPS", "10"))
+VISION_MAX_ATTEMPTS = int(os.getenv("VISION_MAX_ATTEMPTS", "5"))
+# Circuit breaker: opens when, over the rolling window, at least CIRCUIT_ERROR_RATE of the
+# calls failed (5xx, timeouts, connection errors) or CIRCUIT_SLOW_CALL_RATE were slower
+# than CIRCUIT_SLOW_CALL_SECONDS; records fail fast while it is open.
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "10"))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+# Time spent open before CIRCUIT_HALF_OPEN_PROBES probe calls must succeed to close it.
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "3"))
+# Time budget for one skill request; keep it below the skill timeout (30s by default).
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+# Kept free of a caller's deadline (?deadline_seconds= or x-deadline-seconds) to send the response.
+DEADLINE_MARGIN_SECONDS = float(os.getenv("DEADLINE_MARGIN_SECONDS", "2"))
+# Seconds before expiry at which the managed identity token is refreshed in the background.
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "600"))
+CLIENT_INIT_BACKOFF_SECONDS = float(os.getenv("CLIENT_INIT_BACKOFF_SECONDS", "5"))
+CLIENT_INIT_MAX_BACKOFF_SECONDS = float(
+    os.getenv("CLIENT_INIT_MAX_BACKOFF_SECONDS", "300")
+)
+# Log the timing histograms every N batches.
+METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", "50"))
+# Run the sampling profiler for every request (it can also be enabled per request with ?profile=true).
+PROFILE_SAMPLING = os.getenv("PROFILE_SAMPLING", "false").lower() == "true"
+# Pre-warm imports, the managed identity token and the AI Vision connection when the worker starts.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+AI_VISION_SCOPE = "https://cognitiveservices.azure.com/.default"
+HEAVY_MODULES = (
+    "aiohttp",
+    "azure.core.exceptions",
+    "azure.core.pipeline.transport",
+    "azure.core.rest",
+    "azure.identity.aio",
+    "azure.ai.vision.imageanalysis.aio",
+    "azure.ai.vision.imageanalysis.models",
+)
 
 ai_vision_client = None
+ai_vision_credential = None
 client_initialized = False
+# Failed initializations are not retried before next_client_init_attempt (exponential backoff).
+client_init_failures = 0
+next_client_init_attempt = 0.0
+# Serializes initialization between the warm-up task and concurrent first requests.
+client_init_lock = asyncio.Lock()
+batches_processed = 0
+records_processed = 0
+vision_calls = 0
+worker_started = time.time()
+# One long-lived HTTP session shared by every invocation served by this worker,
+# so connections to AI Vision are kept alive and reused across indexer calls.
+http_session = None
+
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    shared_tier=(
+        SqliteCacheTier(RESULT_CACHE_SQLITE_PATH) if RESULT_CACHE_SQLITE_PATH else None
+    ),
+)
+rate_limiter = AdaptiveRateLimiter(max_rate=VISION_MAX_TPS)
+vision_circuit = circuit_breaker.CircuitBreaker(
+    window_seconds=CIRCUIT_WINDOW_SECONDS,
+    min_calls=CIRCUIT_MIN_CALLS,
+    error_rate=CIRCUIT_ERROR_RATE,
+    slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS,
+    slow_call_rate=CIRCUIT_SLOW_CALL_RATE,
+    open_seconds=CIRCUIT_OPEN_SECONDS,
+    half_open_probes=CIRCUIT_HALF_OPEN_PROBES,
+)
+feature_planner = feature_planner_module.FeaturePlanner(
+    strategy=VISION_FEATURE_STRATEGY,
+    caption_languages=CAPTION_LANGUAGES,
+    fallback_language=VISION_FALLBACK_LANGUAGE,
+    max_entries=LANGUAGE_CAPABILITY_MAX_ENTRIES,
+    ttl_seconds=LANGUAGE_CAPABILITY_TTL_SECONDS,
+)
+# Identical images analyzed concurrently (e.g. by parallel indexer batches) share one Vision call.
+single_flight = SingleFlight()
+near_duplicates = image_filter.NearDuplicateIndex(window_size=IMAGE_FILTER_WINDOW_SIZE)
+
+if IMAGE_PREPROCESSING and not image_preprocessing.is_available():
+    logging.warning("IMAGE_PREPROCESSING is enabled but Pillow is not installed.")
+if IMAGE_FILTER and not image_filter.is_available():
+    logging.warning("IMAGE_FILTER is enabled but Pillow is not installed.")
+
+
+async def get_ai_vision_client():
+    """Helper to initialize or get the existing client."""
+    global ai_vision_client, ai_vision_credential, client_initialized, http_session
+    global client_init_failures, next_client_init_attempt
 
+    if client_initialized:
+        return ai_vision_client
 
-def get_ai_vision_client():
-    """Helper to initialize or get the existing client."""
-    global ai_vision_client, client_initialized
+    async with client_init_lock:
+        if client_initialized:
+            return ai_vision_client
+
+        if time.monotonic() < next_client_init_attempt:
+            logging.warning(
+                f"Skipping AI Vision client initialization after {client_init_failures} failures; "
+                f"next attempt in {next_client_init_attempt - time.monotonic():.0f}s."
+            )
+            return None
 
-    if not client_initialized:
         try:
+            import aiohttp
+            from azure.ai.vision.imageanalysis.aio import ImageAnalysisClient
+            from azure.core.pipeline.transport import AioHttpTransport
+            from azure.identity.aio import ManagedIdentityCredential
+
             logging.info(
                 f"Attempting to initialize AI Vision client with endpoint: {AI_VISION_ENDPOINT}"
             )
-            credential = ManagedIdentityCredential()
-            logging.info("Using Managed Identity for authentication.")
             if not AI_VISION_ENDPOINT:
                 raise ValueError("AI_VISION_ENDPOINT environment variable is not set.")
+            credential = RefreshingTokenCredential(
+                ManagedIdentityCredential(),
+                refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS,
+            )
+            logging.info("Using Managed Identity for authentication.")
+            # Acquiring the first token validates the identity and starts background refresh.
+            await credential.get_token(AI_VISION_SCOPE)
+            if http_session is None or http_session.closed:
+                http_session = aiohttp.ClientSession()
             ai_vision_client = ImageAnalysisClient(
                 endpoint=AI_VISION_ENDPOINT,
                 credential=credential,
+                transport=AioHttpTransport(session=http_session, session_owner=False),
+                # 429/503 are retried by call_with_retry so the shared limiter sees them.
+                retry_status=0,
             )
+            ai_vision_credential = credential
             client_initialized = True
+            client_init_failures = 0
             logging.info("AI Vision client initialized successfully.")
         except Exception as e:
-            logging.error(f"Failed to initialize AI Vision client: {e}", exc_info=True)
+            client_init_failures += 1
+            backoff = min(
+                CLIENT_INIT_MAX_BACKOFF_SECONDS,
+                CLIENT_INIT_BACKOFF_SECONDS * 2 ** (client_init_failures - 1),
+            )
+            next_client_init_attempt = time.monotonic() + backoff
+            logging.error(
+                f"Failed to initialize AI Vision client (attempt {client_init_failures}, "
+                f"retrying in {backoff:.0f}s): {e}",
+                exc_info=True,
+            )
             ai_vision_client = None
             client_initialized = False
     return ai_vision_client
 
 
-@app.route(route="aivisionapiv4", auth_level=func.AuthLevel.FUNCTION)
-def aivisionapiv4(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("Function 'aivisionapiv4' invoked.")
+def import_heavy_modules():
+    for module_name in HEAVY_MODULES:
+        importlib.import_module(module_name)
 
-    client = get_ai_vision_client()
-    if not client:
-        logging.error("AI Vision client is not available.")
-        return func.HttpResponse(
-            json.dumps({"error": "AI Vision client could not be initialized."}),
-            status_code=500,
-            mimetype="application/json",
-        )
 
+async def warm_up():
+    """Imports the SDKs, acquires a token and opens the AI Vision connection ahead of the first request."""
+    timings = {}
+    started = time.perf_counter()
     try:
-        req_body = req.get_json()
-    except ValueError:
-        logging.error("Invalid JSON in request.", exc_info=True)
-        return func.HttpResponse(
-            json.dumps({"error": "Invalid JSON in request."}),
-            status_code=400,
-            mimetype="application/json",
+        await asyncio.to_thread(import_heavy_modules)
+        timings["imports"] = time.perf_counter() - started
+
+        # Client initialization includes acquiring the first managed identity token.
+        phase_started = time.perf_counter()
+        client = await get_ai_vision_client()
+        timings["client_and_token"] = time.perf_counter() - phase_started
+        if not client:
+            return
+
+        from azure.core.rest import HttpRequest
+
+        # Any response will do: the point is the TLS handshake and a pooled keep-alive connection.
+        phase_started = time.perf_counter()
+        response = await client.send_request(
+            HttpRequest("GET", AI_VISION_ENDPOINT.rstrip("/") + "/")
+        )
+        await response.read()
+        timings["connection"] = time.perf_counter() - phase_started
+    except Exception as e:
+        logging.warning(f"AI Vision warm-up failed: {e}", exc_info=True)
+    finally:
+        breakdown = ", ".join(
+            f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in timings.items()
+        )
+        logging.info(
+            f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f}ms ({breakdown})."
         )
 
-    use_caption = req.params.get("use_caption", "false").lower() == "true"
-    default_language = req.params.get("default_language", "en")
-    logging.info(f"Caption processing requested: {use_caption}")
-    logging.info(f"Default language set to: {default_language}")
 
-    response_values = []
+def start_warm_up():
+    """Schedules warm_up() on the worker's event loop, or pre-imports in a thread if there is none yet."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        threading.Thread(target=import_heavy_modules, daemon=True).start()
+        logging.info("No running event loop at startup; pre-importing SDKs only.")
+        return None
+    return loop.create_task(warm_up())
+
+
+async def analyze_features(client, image_bytes, visual_features, language_code, deadline):
+    """
+    One rate-limited AI Vision analyze call, bounded by the time left until deadline.
+
+    :raises circuit_breaker.CircuitOpenError: Without calling AI Vision while the circuit is open.
+    """
+
+    async def analyze():
+        global vision_calls
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("The request deadline passed before AI Vision was called.")
+        probe = vision_circuit.acquire()
+        vision_calls += 1
+        started = time.monotonic()
+        try:
+            # read_timeout lets the transport drop the connection; wait_for also
+            # bounds the time spent in the SDK pipeline itself.
+            result = await asyncio.wait_for(
+                client.analyze(
+                    image_data=image_bytes,
+                    visual_features=visual_features,
+                    language=language_code,
+                    read_timeout=remaining,
+                ),
+                remaining,
+            )
+        except Exception as e:
+            failed = circuit_breaker.is_failure(e)
+            if isinstance(e, TimeoutError) and remaining < CIRCUIT_SLOW_CALL_SECONDS:
+                # Cut short by the request deadline, not evidence of a slow service.
+                failed = False
+            vision_circuit.record(failed, time.monotonic() - started, probe)
+            raise
+        except asyncio.CancelledError:
+            vision_circuit.release(probe)
+            raise
+        vision_circuit.record(False, time.monotonic() - started, probe)
+        return result
+
+    # Fail fast before waiting for the rate limiter.
+    vision_circuit.raise_if_open()
+    return await call_with_retry(
+        analyze,
+        rate_limiter,
+        deadline,
+        max_attempts=VISION_MAX_ATTEMPTS,
+    )
+
+
+async def analyze_planned(
+    client, image_bytes, features, language_code, deadline, record_id, record_warnings
+):
+    """
+    Runs the analyze calls the feature planner chooses for one record.
+
+    Calls for language/feature pairs known to be unsupported are not made; the
+    feature is served in the fallback language or reported as a warning.
+
+    :param features: The requested features (READ and optionally CAPTION).
+    :return: Tuple of {feature: analyze result}, whether the outcome may be cached,
+        and whether it is degraded (a feature fell back to another language or was
+        unavailable), which only holds until the learned capabilities expire.
+    """
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
+
+    visual_features = {
+        feature_planner_module.READ: VisualFeatures.READ,
+        feature_planner_module.CAPTION: VisualFeatures.CAPTION,
+    }
+    results = {}
+    unavailable = []
+    cacheable = True
+    degraded = False
+    pending = list(features)
+    # A rejection is learned and planned once more, which picks up the fallback language.
+    for replan in (False, True):
+        calls, skipped = feature_planner.plan(language_code, pending, replan=replan)
+        unavailable.extend(skipped)
+        if calls:
+            logging.info(
+                f"AI Vision calls for record ID {record_id}: "
+                + ", ".join(f"{'+'.join(call.features)} ({call.language})" for call in calls)
+            )
+        outcomes = await asyncio.gather(
+            *(
+                analyze_features(
+                    client,
+                    image_bytes,
+                    [visual_features[feature] for feature in call.features],
+                    call.language,
+                    deadline,
+                )
+                for call in calls
+            ),
+            return_exceptions=True,
+        )
+        pending = []
+        for call, outcome in zip(calls, outcomes):
+            if not isinstance(outcome, BaseException):
+                for feature in call.features:
+                    feature_planner.learn(call.language, feature, True)
+                    results[feature] = outcome
+                    if call.language != language_code:
+                        degraded = True
+                        record_warnings.append(
+                            {
+                                "message": f"'{language_code}' is not supported for {feature}; used '{call.language}' instead."
+                            }
+                        )
+            elif feature_planner_module.is_not_supported_language(outcome):
+                # A combined call does not say which feature was rejected; CAPTION
+                # covers far fewer languages than READ.
+                rejected = (
+                    feature_planner_module.CAPTION
+                    if feature_planner_module.CAPTION in call.features
+                    else call.features[0]
+                )
+                feature_planner.learn(call.language, rejected, False)
+                pending.extend(call.features)
+            elif feature_planner_module.READ in call.features:
+                raise outcome
+            else:
+                logging.warning(
+                    f"Caption call failed for record ID {record_id}, keeping the OCR result: {outcome}"
+                )
+                record_warnings.append(
+                    {"message": f"Caption could not be generated. Details: {outcome}"}
+                )
+                cacheable = False
+        if not pending:
+            break
+    unavailable.extend(pending)
+
+    for feature in unavailable:
+        degraded = True
+        if feature == feature_planner_module.CAPTION:
+            message = f"Captions are not available for language '{language_code}'; only OCR text was extracted."
+        else:
+            message = f"Text extraction is not available for language '{language_code}'."
+        logging.warning(f"{message} Record ID: {record_id}")
+        record_warnings.append({"message": message})
+    return results, cacheable, degraded
+
 
-    values_data = req_body.get("values", [])
+async def process_record(
+    client, record, use_caption, default_language, deadline, spans, layout_options=None
+):
+    """
+    Analyzes a single skill input record and returns its output record.
 
-    for record in values_data:
+    :param layout_options: Dict with min_confidence and max_words to add the
+        structured OCR output (ocr_layout), or None for image_text only.
+    """
+    from azure.core.exceptions import AzureError, HttpResponseError
 
-        record_id = record.get("recordId")
-        record_data = {}
-        record_errors = []
-        record_warnings = []
+    record_id = record.get("recordId")
+    record_data = {}
+    record_errors = []
+    record_warnings = []
 
-        logging.info(f"Processing record ID: {record_id}")
+    logging.info(f"Processing record ID: {record_id}")
 
-        record_input_data_raw = record.get("data", {})
+    record_input_data_raw = record.get("data", {})
 
-        if isinstance(record_input_data_raw, dict):
-            record_input_data = record_input_data_raw
-        else:
-            logging.error(
-                f"Invalid type for 'data' field in record ID {record_id}. Expected object/dict, got {type(record_input_data_raw).__name__}. Skipping image processing for this record."
+    if isinstance(record_input_data_raw, dict):
+        record_input_data = record_input_data_raw
+    else:
+        logging.error(
+            f"Invalid type for 'data' field in record ID {record_id}. Expected object/dict, got {type(record_input_data_raw).__name__}. Skipping image processing for this record."
+        )
+        record_errors.append(
+            {"message": "Invalid format for 'data' field. Expected an object."}
+        )
+        record_input_data = {}
+        image_base64 = None
+
+    if isinstance(record_input_data_raw, dict):
+        image_base64 = record_input_data.get("image")
+        language_code = record_input_data.get("languageCode", default_language)
+        if not isinstance(language_code, str) or not language_code.strip():
+            logging.warning(
+                f"Invalid or missing languageCode for record {record_id}, using default '{default_language}'."
             )
+            language_code = default_language
+        else:
+            language_code = language_code.strip().lower()
+    else:
+        language_code = default_language
+
+    logging.info(f"Using language '{language_code}' for record ID: {record_id}")
+
+    if not image_base64:
+        if not any(
+            err["message"] == "Invalid format for 'data' field. Expected an object."
+            for err in record_errors
+        ):
+            error_msg = f"No image data provided or 'data' field was invalid for record ID: {record_id}."
+            logging.error(error_msg)
             record_errors.append(
-                {"message": "Invalid format for 'data' field. Expected an object."}
+                {"message": "Missing or invalid image data input."}
             )
-            record_input_data = {}
-            image_base64 = None
 
-        if isinstance(record_input_data_raw, dict):
-            image_base64 = record_input_data.get("image")
-            language_code = record_input_data.get("languageCode", default_language)
-            if not isinstance(language_code, str) or not language_code.strip():
+        return {
+            "recordId": record_id,
+            "data": {},
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    duplicate_key = None
+    flight_token = None
+    # What the record returns on success ({"data", "warnings"}), shared with
+    # duplicates waiting on it.
+    published = None
+    try:
+        with spans.span("decode"):
+            image_bytes = decode_image(image_base64)
+        current_ocr_text = ""
+        current_caption = ""
+
+        features = [feature_planner_module.READ]
+        if use_caption:
+            features.append(feature_planner_module.CAPTION)
+
+        output_variant = ""
+        if layout_options:
+            output_variant = f"layout:{layout_options['min_confidence']}:{layout_options['max_words']}"
+        cache_key = make_cache_key(image_bytes, features, language_code, output_variant)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Result cache hit for record ID: {record_id}")
+            record_warnings.extend(cached["warnings"])
+            return {
+                "recordId": record_id,
+                "data": cached["data"],
+                "errors": record_errors,
+                "warnings": record_warnings,
+            }
+        # Warnings from here on belong to the result and are cached with it.
+        result_warnings_start = len(record_warnings)
+
+        # A failed leader wakes every waiting record; the first to begin() leads
+        # the retry and the others wait for it.
+        while flight_token is None:
+            shared = await single_flight.join(cache_key, deadline)
+            if shared is not None:
+                logging.info(
+                    f"Sharing the in-flight result of an identical image for record ID: {record_id}"
+                )
+                record_warnings.extend(shared["warnings"])
+                return {
+                    "recordId": record_id,
+                    "data": shared["data"],
+                    "errors": record_errors,
+                    "warnings": record_warnings,
+                }
+            flight_token = single_flight.begin(cache_key)
+
+        if IMAGE_FILTER and image_filter.is_available():
+            try:
+                skip_reason, fingerprint = await asyncio.to_thread(
+                    image_filter.inspect_image,
+                    image_bytes,
+                    IMAGE_FILTER_MIN_SIDE,
+                    IMAGE_FILTER_MIN_CONTRAST,
+                )
+            except Exception as e:
                 logging.warning(
-                    f"Invalid or missing languageCode for record {record_id}, using default '{default_language}'."
+                    f"Image pre-filter failed for record ID {record_id}, analyzing anyway: {e}"
                 )
-                language_code = default_language
-            else:
-                language_code = language_code.strip().lower()
-        else:
-            language_code = default_language
+                skip_reason, fingerprint = None, None
 
-        logging.info(f"Using language '{language_code}' for record ID: {record_id}")
-
-        if not image_base64:
-            if not any(
-                err["message"] == "Invalid format for 'data' field. Expected an object."
-                for err in record_errors
-            ):
-                error_msg = f"No image data provided or 'data' field was invalid for record ID: {record_id}."
-                logging.error(error_msg)
-                record_errors.append(
-                    {"message": "Missing or invalid image data input."}
+            if skip_reason:
+                logging.info(
+                    f"Skipping AI Vision for record ID {record_id}: image is {skip_reason}."
                 )
-
-            response_values.append(
-                {
+                near_duplicates.record_skip(skip_reason)
+                record_data["image_text"] = ""
+                if use_caption:
+                    record_data["caption"] = ""
+                if layout_options:
+                    record_data["ocr_layout"] = ocr_layout.extract_layout(None)[0]
+                published = {"data": record_data, "warnings": []}
+                return {
                     "recordId": record_id,
-                    "data": {},
+                    "data": record_data,
                     "errors": record_errors,
                     "warnings": record_warnings,
                 }
-            )
-            continue
 
-        try:
-            image_bytes = base64.b64decode(image_base64)
-            current_ocr_text = ""
-            current_caption = ""
-
-            visual_features = [VisualFeatures.READ]
-            if use_caption:
-                visual_features.append(VisualFeatures.CAPTION)
+            if fingerprint is not None:
+                variant = (use_caption, language_code, output_variant)
+                duplicate = await near_duplicates.reuse(fingerprint, variant, deadline)
+                if duplicate is not None:
+                    logging.info(
+                        f"Reusing the result of a duplicate image for record ID: {record_id}"
+                    )
+                    record_warnings.extend(duplicate["warnings"])
+                    published = duplicate
+                    return {
+                        "recordId": record_id,
+                        "data": duplicate["data"],
+                        "errors": record_errors,
+                        "warnings": record_warnings,
+                    }
+                duplicate_key = near_duplicates.begin(fingerprint, variant)
+
+        if IMAGE_PREPROCESSING and image_preprocessing.is_available():
+            try:
+                image_bytes, preprocessing_note = await asyncio.to_thread(
+                    image_preprocessing.preprocess_image,
+                    image_bytes,
+                    IMAGE_MAX_PIXELS,
+                    IMAGE_MAX_BYTES,
+                )
+            except Exception as e:
+                logging.warning(
+                    f"Image preprocessing failed for record ID {record_id}, sending original image: {e}"
+                )
+            else:
+                if preprocessing_note:
+                    logging.info(f"{preprocessing_note} Record ID: {record_id}")
+                    record_warnings.append({"message": preprocessing_note})
 
-            result = client.analyze(
-                image_data=image_bytes,
-                visual_features=visual_features,
-                language=language_code,
+        with spans.span("vision"):
+            results, cacheable, degraded = await analyze_planned(
+                client, image_bytes, features, language_code, deadline, record_id, record_warnings
             )
 
-            if result.read and result.read.blocks:
+        with spans.span("flatten"):
+            read_result = results.get(feature_planner_module.READ)
+            if read_result and read_result.read and read_result.read.blocks:
                 document_contents = [
-                    line.text for block in result.read.blocks for line in block.lines
+                    line.text
+                    for block in read_result.read.blocks
+                    for line in block.lines
                 ]
                 current_ocr_text = " ".join(document_contents)
             else:
                 logging.warning(f"No read results for record ID: {record_id}.")
 
-            if use_caption:
-                if result.caption:
-                    current_caption = result.caption.text
+            caption_result = results.get(feature_planner_module.CAPTION)
+            if caption_result is not None:
+                if caption_result.caption:
+                    current_caption = caption_result.caption.text
                     logging.info(
-                        f"Caption for {record_id}: '{current_caption}', Confidence: {result.caption.confidence:.4f}"
+                        f"Caption for {record_id}: '{current_caption}', Confidence: {caption_result.caption.confidence:.4f}"
                     )
                 else:
                     logging.warning(
                         f"No caption result returned (language: {language_code}) for record ID: {record_id}."
                     )
 
-            record_data["image_text"] = current_ocr_text
-            if use_caption:
-                record_data["caption"] = current_caption
-
-            response_values.append(
-                {
-                    "recordId": record_id,
-                    "data": record_data,
-                    "errors": record_errors,
-                    "warnings": record_warnings,
-                }
-            )
-
-        except (AzureError, HttpResponseError) as e:
-            error_message = str(e)
-            if "NotSupportedLanguage" in error_message or (
-                hasattr(e, "error")
-                and e.error
-                and e.error.code == "NotSupportedLanguage"
-            ):
-                error_msg = f"Language '{language_code}' not supported by AI Vision for the requested features for record ID {record_id}. Error: {e}"
-                logging.error(error_msg)
-                record_errors.append(
+        record_data["image_text"] = current_ocr_text
+        if use_caption:
+            record_data["caption"] = current_caption
+        if layout_options:
+            with spans.span("layout"):
+                record_data["ocr_layout"], truncated = ocr_layout.extract_layout(
+                    read_result.read if read_result else None,
+                    layout_options["min_confidence"],
+                    layout_options["max_words"],
+                )
+            if truncated:
+                record_warnings.append(
                     {
-                        "message": f"Language '{language_code}' not supported for requested features."
+                        "message": f"Structured OCR output truncated to {layout_options['max_words']} words."
                     }
                 )
-            else:
-                error_msg = f"Azure SDK Error processing record ID {record_id}: {e}"
-                logging.error(error_msg, exc_info=True)
-                record_errors.append(
-                    {"message": f"An Azure service error occurred. Details: {str(e)}"}
-                )
-
-            response_values.append(
+        published = {
+            "data": record_data,
+            "warnings": record_warnings[result_warnings_start:],
+        }
+        if cacheable:
+            # A degraded result is re-analyzed once the planner would retry the feature.
+            await result_cache.set(
+                cache_key,
+                published,
+                ttl=LANGUAGE_CAPABILITY_TTL_SECONDS if degraded else None,
+            )
+        return {
+            "recordId": record_id,
+            "data": record_data,
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    except circuit_breaker.CircuitOpenError as e:
+        logging.warning(f"Skipped record ID {record_id}: {e}")
+        record_errors.append(
+            {"message": f"AI Vision is unavailable, retry later. Details: {e}"}
+        )
+        return {
+            "recordId": record_id,
+            "data": {},
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    except VisionThrottledError as e:
+        logging.warning(f"Throttled while processing record ID {record_id}: {e}")
+        record_errors.append(
+            {"message": f"AI Vision is throttling requests, retry later. Details: {e}"}
+        )
+        return {
+            "recordId": record_id,
+            "data": {},
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    except TimeoutError as e:
+        logging.warning(f"Gave up on record ID {record_id}: {e}")
+        record_errors.append({"message": f"Timed out, retry later. Details: {e}"})
+        return {
+            "recordId": record_id,
+            "data": {},
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    except (AzureError, HttpResponseError) as e:
+        if feature_planner_module.is_not_supported_language(e):
+            error_msg = f"Language '{language_code}' not supported by AI Vision for the requested features for record ID {record_id}. Error: {e}"
+            logging.error(error_msg)
+            record_errors.append(
                 {
-                    "recordId": record_id,
-                    "data": {},
-                    "errors": record_errors,
-                    "warnings": record_warnings,
+                    "message": f"Language '{language_code}' not supported for requested features."
                 }
             )
-
-        except Exception as e:
-            error_msg = f"Unexpected error processing record ID {record_id}: {e}"
+        else:
+            error_msg = f"Azure SDK Error processing record ID {record_id}: {e}"
             logging.error(error_msg, exc_info=True)
             record_errors.append(
-                {"message": f"An unexpected error occurred. Details: {str(e)}"}
+                {"message": f"An Azure service error occurred. Details: {str(e)}"}
             )
-            response_values.append(
-                {
-                    "recordId": record_id,
+
+        return {
+            "recordId": record_id,
+            "data": {},
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    except Exception as e:
+        error_msg = f"Unexpected error processing record ID {record_id}: {e}"
+        logging.error(error_msg, exc_info=True)
+        record_errors.append(
+            {"message": f"An unexpected error occurred. Details: {str(e)}"}
+        )
+        return {
+            "recordId": record_id,
+            "data": {},
+            "errors": record_errors,
+            "warnings": record_warnings,
+        }
+
+    finally:
+        if duplicate_key is not None:
+            near_duplicates.finish(duplicate_key, published)
+        if flight_token is not None:
+            single_flight.finish(flight_token, published)
+
+
+logging.info(
+    f"Function app module loaded in {(time.perf_counter() - module_load_started) * 1000:.0f}ms."
+)
+warm_up_task = start_warm_up() if STARTUP_WARMUP else None
+
+
+@app.route(route="aivisionapiv4", auth_level=func.AuthLevel.FUNCTION)
+async def aivisionapiv4(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Function 'aivisionapiv4' invoked.")
+
+    profiler = None
+    if PROFILE_SAMPLING or req.params.get("profile", "false").lower() == "true":
+        profiler = SamplingProfiler().start()
+    try:
+        return await analyze_batch(req)
+    finally:
+        if profiler is not None:
+            logging.info(profiler.stop().report())
+
+
+def request_deadline(req, started):
+    """
+    The time.monotonic() value by which the batch has to be answered.
+
+    A caller can pass its own timeout in seconds as ?deadline_seconds= or the
+    x-deadline-seconds header; DEADLINE_MARGIN_SECONDS of it are kept for
+    sending the response. Without one, REQUEST_DEADLINE_SECONDS applies.
+    """
+    value = req.params.get("deadline_seconds") or req.headers.get("x-deadline-seconds")
+    budget = REQUEST_DEADLINE_SECONDS
+    if value:
+        try:
+            budget = float(value) - DEADLINE_MARGIN_SECONDS
+        except ValueError:
+            logging.warning(f"Ignoring invalid deadline '{value}'.")
+    return started + max(0.0, budget)
+
+
+def deadline_exceeded_record(req_body, offsets):
+    """Output record for a record that did not finish before the deadline."""
+    try:
+        record_id = load_record(req_body, offsets).get("recordId")
+    except (ValueError, AttributeError):
+        record_id = None
+    return {
+        "recordId": record_id,
+        "data": {},
+        "errors": [
+            {
+                "message": "Request deadline reached before this record was analyzed, retry later."
+            }
+        ],
+        "warnings": [],
+    }
+
+
+async def analyze_batch(req):
+    """Handles one skill request; split out of aivisionapiv4 so it can be profiled as a whole."""
+    global batches_processed, records_processed
+
+    batch_spans = Spans("batch")
+    batch_started = time.perf_counter()
+    batch_started_monotonic = time.monotonic()
+
+    client = await get_ai_vision_client()
+    if not client:
+        logging.error("AI Vision client is not available.")
+        return func.HttpResponse(
+            json.dumps({"error": "AI Vision client could not be initialized."}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+    try:
+        # The payload is scanned rather than parsed, so each record (and its
+        # base64 image) is only materialized when a worker picks it up.
+        with batch_spans.span("parse"):
+            req_body = req.get_body()
+            record_offsets = split_records(req_body)
+    except ValueError:
+        logging.error("Invalid JSON in request.", exc_info=True)
+        return func.HttpResponse(
+            json.dumps({"error": "Invalid JSON in request."}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    use_caption = req.params.get("use_caption", "false").lower() == "true"
+    default_language = req.params.get("default_language", "en")
+    layout_options = None
+    if req.params.get("ocr_output", OCR_OUTPUT).lower() == "structured":
+        try:
+            min_confidence = float(
+                req.params.get("min_confidence", OCR_MIN_CONFIDENCE)
+            )
+        except ValueError:
+            min_confidence = OCR_MIN_CONFIDENCE
+        layout_options = {"min_confidence": min_confidence, "max_words": OCR_MAX_WORDS}
+    logging.info(f"Caption processing requested: {use_caption}")
+    logging.info(f"Default language set to: {default_language}")
+
+    logging.info(
+        f"Processing {len(record_offsets)} records with up to {MAX_CONCURRENT_RECORDS} concurrent Vision calls."
+    )
+
+    deadline = request_deadline(req, batch_started_monotonic)
+    semaphore = asyncio.Semaphore(max(1, MAX_CONCURRENT_RECORDS))
+
+    async def bounded_process_record(offsets):
+        async with semaphore:
+            spans = Spans("record")
+            record_started = time.perf_counter()
+            try:
+                with spans.span("parse"):
+                    record = load_record(req_body, offsets)
+            except ValueError:
+                logging.error("Invalid JSON in record.", exc_info=True)
+                record_output = {
+                    "recordId": None,
                     "data": {},
-                    "errors": record_errors,
-                    "warnings": record_warnings,
+                    "errors": [{"message": "Invalid JSON in record."}],
+                    "warnings": [],
                 }
+            else:
+                record_output = await process_record(
+                    client,
+                    record,
+                    use_caption,
+                    default_language,
+                    deadline,
+                    spans,
+                    layout_options,
+                )
+            # Serialize as soon as the record finishes so its data can be released.
+            with spans.span("serialize"):
+                encoded = json.dumps(record_output)
+            spans.durations["total"] = time.perf_counter() - record_started
+            spans.flush()
+            logging.info(
+                f"Record ID {record_output['recordId']} timings: {spans.describe()}"
             )
+            return encoded
+
+    # Records still running at the deadline are cancelled and answered with a
+    # retryable error, so the records that finished are not lost with the batch.
+    with batch_spans.span("records"):
+        tasks = [
+            asyncio.create_task(bounded_process_record(offsets))
+            for offsets in record_offsets
+        ]
+        pending = set()
+        if tasks:
+            # asyncio.wait rejects an empty set; an empty batch is still valid.
+            _, pending = await asyncio.wait(
+                tasks, timeout=max(0.0, deadline - time.monotonic())
+            )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        encoded_values = [
+            task.result()
+            if task not in pending
+            else json.dumps(deadline_exceeded_record(req_body, offsets))
+            for task, offsets in zip(tasks, record_offsets)
+        ]
+    if pending:
+        logging.warning(
+            f"Request deadline reached with {len(pending)} of {len(tasks)} records unfinished."
+        )
+    with batch_spans.span("serialize"):
+        response_body = '{"values": [' + ", ".join(encoded_values) + "]}"
+    batch_spans.durations["total"] = time.perf_counter() - batch_started
+    batch_spans.flush()
+
+    logging.info(f"Batch of {len(record_offsets)} timings: {batch_spans.describe()}")
+    logging.info(f"Result cache stats: {result_cache.stats()}")
+    logging.info(f"Single-flight stats: {single_flight.stats()}")
+    logging.info(f"AI Vision circuit: {vision_circuit.stats()}")
+    logging.info(f"Credential metrics: {ai_vision_credential.metrics()}")
+    logging.info(f"AI Vision language capabilities: {feature_planner.capabilities()}")
+    if IMAGE_FILTER:
+        logging.info(f"Image pre-filter stats: {near_duplicates.stats()}")
+    batches_processed += 1
+    records_processed += len(record_offsets)
+    if METRICS_LOG_INTERVAL > 0 and batches_processed % METRICS_LOG_INTERVAL == 0:
+        log_snapshot()
 
     return func.HttpResponse(
-        json.dumps({"values": response_values}),
+        response_body,
         status_code=200,
         mimetype="application/json",
     )
+
+
+@app.route(route="stats", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+async def stats(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Counters of this worker since it started.
+
+    Records received are the images the indexer did not serve from its
+    enrichment cache. Counters are per instance; with several instances a
+    call only sees the one that answers it.
+    """
+    body = {
+        "instance": os.getenv("WEBSITE_INSTANCE_ID", "local"),
+        "worker_started": worker_started,
+        "batches_processed": batches_processed,
+        "records_processed": records_processed,
+        "vision_calls": vision_calls,
+        "result_cache": result_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "circuit": vision_circuit.stats(),
+        "language_capabilities": feature_planner.capabilities(),
+    }
+    if IMAGE_FILTER:
+        body["image_filter"] = near_duplicates.stats()
+    return func.HttpResponse(
+        json.dumps(body), status_code=200, mimetype="application/json"
+    )
+
+
+@app.route(route="health", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+async def health(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Cheap liveness and AI Vision circuit state for monitoring to poll.
+
+    Always answers 200 while the worker runs: an open circuit means AI Vision
+    is failing, not this instance, so a platform health check must not
+    recycle the instance for it. Monitoring alerts on "status" instead.
+    """
+    state = vision_circuit.state
+    body = {
+        "status": "degraded" if state != circuit_breaker.CLOSED else "ok",
+        "circuit": state,
+        "client_initialized": client_initialized,
+        "uptime_s": round(time.time() - worker_started),
+    }
+    return func.HttpResponse(
+        json.dumps(body), status_code=200, mimetype="application/json"
+    )
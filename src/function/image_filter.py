@@ -0,0 +1,133 @@
+import asyncio
+import importlib.util
+import io
+import time
+from collections import OrderedDict
+
+TOO_SMALL = "too_small"
+UNIFORM = "uniform"
+HASH_SIZE = 32
+# Longest side of the grayscale copy the blank check runs on.
+BLANK_CHECK_SIZE = 1024
+
+
+def is_available():
+    return importlib.util.find_spec("PIL") is not None
+
+
+def inspect_image(image_bytes, min_side, min_contrast):
+    """
+    Cheap pre-filter run before an image is sent to AI Vision.
+
+    :param image_bytes: The decoded image bytes.
+    :param min_side: Images with a smaller width or height are rejected.
+    :param min_contrast: Images whose darkest and brightest grayscale pixels differ by less count as blank.
+    :return: Tuple of (rejection reason TOO_SMALL/UNIFORM or None, fingerprint or None).
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        size = image.size
+        if min(size) < min_side:
+            return TOO_SMALL, None
+        image.draft("L", (BLANK_CHECK_SIZE, BLANK_CHECK_SIZE))
+        grayscale = image.convert("L")
+        grayscale.thumbnail((BLANK_CHECK_SIZE, BLANK_CHECK_SIZE))
+
+    # A page is blank only if no pixel stands out: a single line of small text
+    # averages away in a small thumbnail (and barely moves the variance), but
+    # still leaves dark pixels at this resolution.
+    darkest, brightest = grayscale.getextrema()
+    if brightest - darkest < min_contrast:
+        return UNIFORM, None
+
+    # dHash over a 33x32 grayscale thumbnail (1024 bits); a 64-bit hash maps
+    # different pages of text to nearly the same value. Only an exact match of
+    # the hash and the original size counts as a duplicate, since reusing the
+    # wrong page's OCR text is worse than one more AI Vision call.
+    pixels = list(grayscale.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata())
+    dhash = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            dhash = (dhash << 1) | (left > right)
+    return None, (size, dhash)
+
+
+class NearDuplicateIndex:
+    """
+    Reuses results of images with the same fingerprint (see inspect_image).
+
+    Images still being analyzed (in this or a concurrent request) are tracked as
+    pending futures; finished results are kept in a bounded recent window.
+    """
+
+    def __init__(self, window_size=256):
+        self.window_size = window_size
+        self._pending = {}
+        self._recent = OrderedDict()
+        self.skipped_small = 0
+        self.skipped_uniform = 0
+        self.duplicates_reused = 0
+
+    async def reuse(self, fingerprint, variant, deadline):
+        """
+        Returns the {"data", "warnings"} output of a duplicate image, or None.
+
+        :param fingerprint: Fingerprint of the image from inspect_image.
+        :param variant: Anything else the result depends on (features, language).
+        :param deadline: time.monotonic() value after which pending results are not awaited.
+        """
+        key = (fingerprint, variant)
+        future = self._pending.get(key)
+        if future is not None:
+            try:
+                data = await asyncio.wait_for(
+                    asyncio.shield(future), max(0.0, deadline - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                data = None
+            if data is not None:
+                self.duplicates_reused += 1
+                return dict(data)
+
+        data = self._recent.get(key)
+        if data is None:
+            return None
+        self._recent.move_to_end(key)
+        self.duplicates_reused += 1
+        return dict(data)
+
+    def begin(self, fingerprint, variant):
+        """Registers an image whose analysis is starting; returns the key for finish()."""
+        key = (fingerprint, variant)
+        self._pending.setdefault(key, asyncio.get_running_loop().create_future())
+        return key
+
+    def finish(self, key, data):
+        """Publishes the result (None on failure) of an analysis started with begin()."""
+        future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+        if data:
+            self._recent[key] = dict(data)
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.window_size:
+                self._recent.popitem(last=False)
+
+    def record_skip(self, reason):
+        if reason == TOO_SMALL:
+            self.skipped_small += 1
+        elif reason == UNIFORM:
+            self.skipped_uniform += 1
+
+    def stats(self):
+        return {
+            "skipped_small": self.skipped_small,
+            "skipped_uniform": self.skipped_uniform,
+            "duplicates_reused": self.duplicates_reused,
+            "vision_calls_avoided": self.skipped_small
+            + self.skipped_uniform
+            + self.duplicates_reused,
+        }
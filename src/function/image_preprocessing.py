@@ -0,0 +1,71 @@
+import importlib.util
+import io
+import math
+
+# AI Vision Image Analysis 4.0 input limits.
+VISION_MAX_SIDE = 16000
+VISION_MIN_SIDE = 50
+VISION_MAX_BYTES = 20 * 1024 * 1024
+
+
+def is_available():
+    # Pillow is only imported once an image is actually processed, to keep cold starts fast.
+    return importlib.util.find_spec("PIL") is not None
+
+
+def preprocess_image(image_bytes, max_pixels, max_bytes, jpeg_quality=90):
+    """
+    Downscales and re-encodes an image that exceeds the pixel or byte budget.
+
+    Only the image header is read to decide; images within budget are returned
+    untouched without being decoded.
+
+    :param image_bytes: The decoded image bytes.
+    :param max_pixels: Largest width * height sent to AI Vision.
+    :param max_bytes: Largest encoded size sent to AI Vision.
+    :param jpeg_quality: Quality used when re-encoding as JPEG.
+    :return: Tuple of (image bytes to send, description of the change or None).
+    """
+    from PIL import Image
+
+    max_bytes = min(max_bytes, VISION_MAX_BYTES)
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        width, height = image.size
+        scale = min(
+            1.0,
+            math.sqrt(max_pixels / (width * height)),
+            VISION_MAX_SIDE / max(width, height),
+        )
+        # Never shrink below the smallest size AI Vision accepts.
+        scale = max(scale, min(1.0, VISION_MIN_SIDE / min(width, height)))
+        if scale >= 1.0 and len(image_bytes) <= max_bytes:
+            return image_bytes, None
+
+        keep_alpha = image.mode in ("RGBA", "LA", "P") and image.format != "JPEG"
+        while True:
+            target = (max(1, round(width * scale)), max(1, round(height * scale)))
+            if image.format == "JPEG":
+                # Lets the JPEG decoder skip DCT coefficients it would throw away anyway.
+                image.draft("RGB", target)
+            resized = image.convert("RGBA" if keep_alpha else "RGB")
+            if resized.size != target:
+                resized = resized.resize(target, Image.LANCZOS)
+
+            output = io.BytesIO()
+            if keep_alpha:
+                resized.save(output, format="PNG", optimize=True)
+            else:
+                resized.save(output, format="JPEG", quality=jpeg_quality)
+            processed = output.getvalue()
+
+            smallest_scale = VISION_MIN_SIDE / min(width, height)
+            if len(processed) <= max_bytes or scale * 0.8 < smallest_scale:
+                break
+            scale *= 0.8
+
+    if len(processed) >= len(image_bytes) and scale >= 1.0:
+        return image_bytes, None
+    return processed, (
+        f"Image downscaled from {width}x{height} ({len(image_bytes) / 1024:.0f} KB) "
+        f"to {target[0]}x{target[1]} ({len(processed) / 1024:.0f} KB) before analysis."
+    )
@@ -0,0 +1,157 @@
+import collections
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Histogram:
+    """Keeps the most recent samples of one metric and reports percentiles over them."""
+
+    def __init__(self, max_samples=2048):
+        self._samples = collections.deque(maxlen=max_samples)
+        self.count = 0
+
+    def add(self, value):
+        self._samples.append(value)
+        self.count += 1
+
+    def percentile(self, percent):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50_ms": _ms(self.percentile(50)),
+            "p95_ms": _ms(self.percentile(95)),
+            "p99_ms": _ms(self.percentile(99)),
+            "max_ms": _ms(max(self._samples)) if self._samples else None,
+        }
+
+
+class InMemorySink:
+    """
+    Metrics sink that keeps a histogram per span name in memory.
+
+    A sink is any object with record(name, seconds) and snapshot(); replace the
+    default with set_sink() to export elsewhere (e.g. Application Insights).
+    """
+
+    def __init__(self, max_samples=2048):
+        self.max_samples = max_samples
+        self.histograms = {}
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(self.max_samples)
+        histogram.add(seconds)
+
+    def snapshot(self):
+        return {
+            name: histogram.summary()
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+
+_sink = InMemorySink()
+
+
+def get_sink():
+    return _sink
+
+
+def set_sink(sink):
+    global _sink
+    _sink = sink
+
+
+class Spans:
+    """Accumulates the duration of named phases of one record or one batch."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.durations = collections.defaultdict(float)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.perf_counter() - started
+
+    def flush(self):
+        """Sends the accumulated durations to the sink as '<scope>.<phase>'."""
+        sink = get_sink()
+        for name, seconds in self.durations.items():
+            sink.record(f"{self.scope}.{name}", seconds)
+
+    def describe(self):
+        return ", ".join(
+            f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.durations.items()
+        )
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval from a background thread.
+
+    Meant for the event loop thread of the worker: the report shows where the
+    handler itself spends CPU time, as opposed to waiting on AI Vision.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005, depth=8):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.depth = depth
+        self.samples = 0
+        self._counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def report(self, limit=15):
+        lines = [
+            f"Sampling profile ({self.samples} samples, "
+            f"{self.interval * 1000:.0f}ms interval):"
+        ]
+        for stack, count in self._counts.most_common(limit):
+            lines.append(f"{count / max(1, self.samples):6.1%}  {stack}")
+        return "\n".join(lines)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self._counts[" <- ".join(stack)] += 1
+            self.samples += 1
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def log_snapshot():
+    logging.info(f"Timing histograms: {get_sink().snapshot()}")
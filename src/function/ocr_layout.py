@@ -0,0 +1,48 @@
+def flatten_polygon(polygon):
+    """[{x, y}, ...] points as one flat [x0, y0, x1, y1, ...] list."""
+    return [coordinate for point in polygon or () for coordinate in (point.x, point.y)]
+
+
+def extract_layout(read_result, min_confidence=0.0, max_words=5000):
+    """
+    Builds the structured OCR output of a READ result.
+
+    Lines and words are stored as parallel arrays (column per attribute)
+    rather than one dict per item, which keeps the skill response compact.
+    Each word refers to its line by index.
+
+    :param read_result: The read attribute of an AI Vision analyze result.
+    :param min_confidence: Words below this confidence are dropped, and lines left without words.
+    :param max_words: Words kept at most, so the response size stays bounded.
+    :return: Tuple of the layout dict and whether words were cut off at max_words.
+    """
+    lines = {"text": [], "boundingPolygon": []}
+    words = {"text": [], "confidence": [], "line": [], "boundingPolygon": []}
+    truncated = False
+
+    for block in (read_result.blocks if read_result else None) or ():
+        for line in block.lines:
+            kept = [
+                word
+                for word in line.words or ()
+                if word.confidence is None or word.confidence >= min_confidence
+            ]
+            if line.words and not kept:
+                continue
+            if len(words["text"]) + len(kept) > max_words:
+                truncated = True
+                break
+            line_index = len(lines["text"])
+            lines["text"].append(line.text)
+            lines["boundingPolygon"].append(flatten_polygon(line.bounding_polygon))
+            for word in kept:
+                words["text"].append(word.text)
+                words["confidence"].append(
+                    None if word.confidence is None else round(word.confidence, 3)
+                )
+                words["line"].append(line_index)
+                words["boundingPolygon"].append(flatten_polygon(word.bounding_polygon))
+        if truncated:
+            break
+
+    return {"lines": lines, "words": words}, truncated
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Part of every key; bumped when the shape of the cached values changes, so a
+# shared tier written by an older version is not read back.
+CACHE_FORMAT = "2"
+
+
+def make_cache_key(image_bytes, visual_features, language_code, output_variant=""):
+    """
+    Builds a content-addressed cache key for one analyze call.
+
+    :param image_bytes: The decoded image bytes sent to AI Vision.
+    :param visual_features: The requested VisualFeatures.
+    :param language_code: The language passed to AI Vision.
+    :param output_variant: Distinguishes output shapes built from the same analyze result.
+    :return: Hex digest identifying the image, feature set, language and output variant.
+    """
+    features = ",".join(sorted(str(getattr(f, "value", f)) for f in visual_features))
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"|{CACHE_FORMAT}|{features}|{language_code}".encode("utf-8"))
+    if output_variant:
+        digest.update(f"|{output_variant}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SqliteCacheTier:
+    """
+    Shared cache tier backed by a local SQLite file.
+
+    Stand-in for a shared store (e.g. Redis) when running locally or in tests.
+    Any object with the same get(key)/set(key, value) methods can be used as a
+    shared tier.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)",
+                (key, json.dumps(value)),
+            )
+
+
+class ResultCache:
+    """
+    Two-tier cache for flattened AI Vision results.
+
+    A bounded in-process LRU tier answers repeated images without any I/O; the
+    optional shared tier survives restarts and is shared between instances.
+    Entries stored with a ttl carry their wall-clock expiry in the value, so
+    both tiers drop them once it has passed.
+    """
+
+    def __init__(self, max_entries=1024, shared_tier=None):
+        self.max_entries = max_entries
+        self.shared_tier = shared_tier
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        """Returns a copy of the cached value for key, or None."""
+        value = self._entries.get(key)
+        if value is not None and _expired(value):
+            del self._entries[key]
+            value = None
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _without_expiry(value)
+
+        if self.shared_tier is not None:
+            try:
+                value = await asyncio.to_thread(self.shared_tier.get, key)
+            except Exception as e:
+                logging.warning(f"Shared result cache lookup failed: {e}")
+                value = None
+            if value is not None and not _expired(value):
+                self._remember(key, value)
+                self.shared_hits += 1
+                return _without_expiry(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, value, ttl=None):
+        """
+        Stores a value for key in every tier.
+
+        :param value: JSON-serializable dict.
+        :param ttl: Seconds the entry stays valid; None keeps it until evicted.
+        """
+        value = dict(value)
+        if ttl is not None:
+            value["expires_at"] = time.time() + ttl
+        self._remember(key, value)
+        if self.shared_tier is not None:
+            try:
+                await asyncio.to_thread(self.shared_tier.set, key, value)
+            except Exception as e:
+                logging.warning(f"Shared result cache write failed: {e}")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _expired(value):
+    expires_at = value.get("expires_at")
+    return expires_at is not None and expires_at <= time.time()
+
+
+def _without_expiry(value):
+    value = dict(value)
+    value.pop("expires_at", None)
+    return value
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+
+class SingleFlight:
+    """
+    Lets concurrent analyses of the same image share one AI Vision call.
+
+    The first record with a key leads and runs the analysis; records with the
+    same key arriving while it is in flight, in this or a concurrent invocation
+    served by the worker, wait for its result instead of calling Vision again.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.leader_failures = 0
+        self.wait_timeouts = 0
+
+    async def join(self, key, deadline):
+        """
+        Waits for an in-flight analysis of key.
+
+        :param key: Cache key of the image, features, language and output variant.
+        :param deadline: time.monotonic() value after which the wait is given up.
+        :return: A copy of the leader's {"data", "warnings"} output, or None if nothing is in flight or the leader failed.
+        :raises TimeoutError: If the leader did not finish before the deadline.
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            return None
+        try:
+            data = await asyncio.wait_for(
+                asyncio.shield(future), max(0.0, deadline - time.monotonic())
+            )
+        except asyncio.TimeoutError:
+            self.wait_timeouts += 1
+            raise TimeoutError(
+                "Timed out waiting for a concurrent analysis of the same image."
+            )
+        if data is None:
+            self.leader_failures += 1
+            return None
+        self.coalesced += 1
+        return dict(data)
+
+    def begin(self, key):
+        """
+        Registers the caller as the leader for key.
+
+        :return: Ownership token for finish(), or None if another record already
+            leads key; join() it instead.
+        """
+        if key in self._in_flight:
+            return None
+        self.leaders += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        return key, future
+
+    def finish(self, token, data):
+        """Publishes the leader's {"data", "warnings"} output (None on failure) to the waiting records."""
+        key, future = token
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if not future.done():
+            future.set_result(data)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "leader_failures": self.leader_failures,
+            "wait_timeouts": self.wait_timeouts,
+        }
@@ -0,0 +1,163 @@
+import base64
+import binascii
+import json
+import re
+
+_WHITESPACE = b" \t\r\n"
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+
+
+def split_records(body):
+    """
+    Locates the records of the skill payload's "values" array without parsing them.
+
+    Only the JSON structure is scanned, so no Python objects are created for the
+    (large) base64 image strings. Structural errors raise ValueError up front.
+
+    :param body: The raw request body.
+    :return: List of (start, end) byte offsets, one per record.
+    """
+    pos = _skip_whitespace(body, 0)
+    if pos >= len(body) or body[pos] != ord("{"):
+        raise ValueError("Request body is not a JSON object.")
+
+    for key, value_start, value_end in _object_members(body, pos):
+        if key != "values":
+            continue
+        if body[value_start] != ord("["):
+            raise ValueError("'values' is not a JSON array.")
+        return list(_array_items(body, value_start))
+    return []
+
+
+def load_record(body, span):
+    """
+    Parses one record, leaving its image as a zero-copy view into the body.
+
+    :param body: The raw request body.
+    :param span: The (start, end) offsets returned by split_records.
+    :return: The record dict; data.image is a memoryview (or str if escaped).
+    """
+    start, end = span
+    image_span = None
+    if body[start] == ord("{"):
+        for key, value_start, value_end in _object_members(body, start):
+            if key == "data" and body[value_start] == ord("{"):
+                for data_key, image_start, image_end in _object_members(
+                    body, value_start
+                ):
+                    if data_key == "image" and body[image_start] == ord('"'):
+                        image_span = (image_start, image_end)
+
+    if image_span is None:
+        return json.loads(body[start:end])
+
+    image_start, image_end = image_span
+    record = json.loads(body[start:image_start] + b"null" + body[image_end:end])
+    if body.find(b"\\", image_start, image_end) != -1:
+        # Escaped characters (e.g. "\/") need the regular JSON string decoder.
+        record["data"]["image"] = json.loads(body[image_start:image_end])
+    else:
+        record["data"]["image"] = memoryview(body)[image_start + 1 : image_end - 1]
+    return record
+
+
+def decode_image(image):
+    """Decodes a base64 image given as str or as a bytes-like view."""
+    if isinstance(image, str):
+        return base64.b64decode(image)
+    return binascii.a2b_base64(image)
+
+
+def _skip_whitespace(body, pos):
+    while pos < len(body) and body[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _string_end(body, pos):
+    """Returns the offset just past the JSON string starting at pos."""
+    search_from = pos + 1
+    while True:
+        quote = body.find(b'"', search_from)
+        if quote == -1:
+            raise ValueError("Unterminated string in request body.")
+        backslashes = 0
+        while body[quote - 1 - backslashes] == ord("\\"):
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return quote + 1
+        search_from = quote + 1
+
+
+def _value_end(body, pos):
+    """Returns the offset just past the JSON value starting at pos."""
+    if pos >= len(body):
+        raise ValueError("Unexpected end of request body.")
+    first = body[pos]
+    if first == ord('"'):
+        return _string_end(body, pos)
+    if first not in b"{[":
+        end = pos
+        while end < len(body) and body[end] not in b",]}" + _WHITESPACE:
+            end += 1
+        if end == pos:
+            raise ValueError(f"Unexpected character at offset {pos}.")
+        return end
+
+    depth = 0
+    search_from = pos
+    while True:
+        match = _STRUCTURAL.search(body, search_from)
+        if match is None:
+            raise ValueError("Unterminated object or array in request body.")
+        char = match.group()
+        if char == b'"':
+            search_from = _string_end(body, match.start())
+            continue
+        depth += 1 if char in b"{[" else -1
+        search_from = match.end()
+        if depth == 0:
+            return search_from
+
+
+def _object_members(body, pos):
+    """Yields (key, value_start, value_end) for the JSON object starting at pos."""
+    pos = _skip_whitespace(body, pos + 1)
+    if pos < len(body) and body[pos] == ord("}"):
+        return
+    while True:
+        if pos >= len(body) or body[pos] != ord('"'):
+            raise ValueError(f"Expected an object key at offset {pos}.")
+        key_end = _string_end(body, pos)
+        key = json.loads(body[pos:key_end])
+        pos = _skip_whitespace(body, key_end)
+        if pos >= len(body) or body[pos] != ord(":"):
+            raise ValueError(f"Expected ':' at offset {pos}.")
+        value_start = _skip_whitespace(body, pos + 1)
+        value_end = _value_end(body, value_start)
+        yield key, value_start, value_end
+        pos = _skip_whitespace(body, value_end)
+        if pos < len(body) and body[pos] == ord(","):
+            pos = _skip_whitespace(body, pos + 1)
+        elif pos < len(body) and body[pos] == ord("}"):
+            return
+        else:
+            raise ValueError(f"Expected ',' or '}}' at offset {pos}.")
+
+
+def _array_items(body, pos):
+    """Yields (start, end) for each item of the JSON array starting at pos."""
+    pos = _skip_whitespace(body, pos + 1)
+    if pos < len(body) and body[pos] == ord("]"):
+        return
+    while True:
+        item_end = _value_end(body, pos)
+        yield pos, item_end
+        pos = _skip_whitespace(body, item_end)
+        if pos < len(body) and body[pos] == ord(","):
+            pos = _skip_whitespace(body, pos + 1)
+        elif pos < len(body) and body[pos] == ord("]"):
+            return
+        else:
+            raise ValueError(f"Expected ',' or ']' at offset {pos}.")
@@ -0,0 +1,140 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+
+# Status codes AI Vision uses for throttling and transient unavailability.
+RETRYABLE_STATUS_CODES = (429, 503)
+
+
+class VisionThrottledError(Exception):
+    """Raised when a throttled call cannot be retried before the request deadline."""
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every AI Vision call of this worker.
+
+    The rate grows additively after successful calls and is halved on throttling
+    responses (AIMD), so sustained throughput settles just below the provisioned
+    TPS instead of alternating between bursts and 429s. A Retry-After from the
+    service pauses the bucket for everybody.
+    """
+
+    def __init__(self, max_rate, min_rate=1.0, increase_step=0.5):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.increase_step = increase_step
+        self.rate = max_rate
+        # A call needs a whole token, so the bucket holds at least one even
+        # below 1 TPS; it then refills at rate tokens per second.
+        self.capacity = max(1.0, max_rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self.throttled = 0
+
+    async def acquire(self, deadline):
+        """
+        Waits for a token.
+
+        :param deadline: time.monotonic() value by which the call must have started.
+        :return: True once a token was taken, False if the deadline would pass first.
+        """
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._paused_until and self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            if now + wait >= deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase_step / self.rate)
+
+    def on_throttle(self, retry_after=None):
+        self.throttled += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + retry_after
+            )
+        logging.warning(
+            f"AI Vision throttled the request. Rate lowered to {self.rate:.2f} calls/s"
+            + (f", pausing for {retry_after:.1f}s." if retry_after else ".")
+        )
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+
+def get_retry_after(error):
+    """Returns the Retry-After of an HTTP error in seconds, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after-ms", "x-ms-retry-after-ms"):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Malformed header: fall back to the jittered backoff.
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+async def call_with_retry(
+    operation, limiter, deadline, max_attempts=5, base_delay=0.5, max_delay=8.0
+):
+    """
+    Runs operation() through the limiter, retrying throttled calls with jittered backoff.
+
+    :param operation: Coroutine function performing one AI Vision call.
+    :param limiter: The shared AdaptiveRateLimiter.
+    :param deadline: time.monotonic() value after which no further attempt is started.
+    :param max_attempts: Maximum number of attempts including the first one.
+    :return: The result of operation().
+    :raises VisionThrottledError: If the call is still throttled when time or attempts run out.
+    """
+    attempt = 0
+    while True:
+        if not await limiter.acquire(deadline):
+            raise VisionThrottledError(
+                "AI Vision rate limit could not be satisfied before the request deadline."
+            )
+        attempt += 1
+        try:
+            result = await operation()
+        except Exception as e:
+            if getattr(e, "status_code", None) not in RETRYABLE_STATUS_CODES:
+                raise
+            retry_after = get_retry_after(e)
+            limiter.on_throttle(retry_after)
+            backoff = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            delay = max(retry_after or 0.0, backoff)
+            if attempt >= max_attempts or time.monotonic() + delay >= deadline:
+                raise VisionThrottledError(
+                    f"AI Vision is throttling requests (HTTP {e.status_code}); gave up after {attempt} attempts."
+                ) from e
+            await asyncio.sleep(delay)
+        else:
+            limiter.on_success()
+            return result
@@ -0,0 +1,116 @@
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "function"))
+
+from skill_payload import decode_image, load_record, split_records  # noqa: E402
+
+
+def write_payload(path, batch_size, image_kb):
+    image_base64 = base64.b64encode(os.urandom(image_kb * 1024)).decode("utf-8")
+    data = {
+        "values": [
+            {
+                "recordId": str(i),
+                "data": {"image": image_base64, "languageCode": "en"},
+            }
+            for i in range(batch_size)
+        ]
+    }
+    with open(path, "w", encoding="utf-8") as payload_file:
+        json.dump(data, payload_file)
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_get_json(body, concurrency):
+    """Mirrors req.get_json() followed by base64.b64decode per record."""
+    records = json.loads(body)["values"]
+    for offset in range(0, len(records), concurrency):
+        in_flight = [
+            base64.b64decode(record["data"]["image"])
+            for record in records[offset : offset + concurrency]
+        ]
+        del in_flight
+
+
+def run_streaming(body, concurrency):
+    """Mirrors split_records() plus load_record()/decode_image() per worker slot."""
+    spans = split_records(body)
+    for offset in range(0, len(spans), concurrency):
+        in_flight = [
+            decode_image(load_record(body, span)["data"]["image"])
+            for span in spans[offset : offset + concurrency]
+        ]
+        del in_flight
+
+
+def measure(mode, path, batch_size, concurrency, results):
+    with open(path, "rb") as payload_file:
+        body = payload_file.read()
+    body_rss = current_rss_mb()
+    if mode == "get_json":
+        run_get_json(body, concurrency)
+    else:
+        run_streaming(body, concurrency)
+    peak = peak_rss_mb()
+    results.put(
+        {
+            "mode": mode,
+            "batch_size": batch_size,
+            "payload_mb": round(len(body) / 2**20, 2),
+            "peak_rss_mb": round(peak, 1),
+            "overhead_mb": round(peak - body_rss, 1),
+        }
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare peak RSS of get_json() and streaming payload parsing"
+    )
+    parser.add_argument(
+        "--batch-sizes", default="1,4,8,16,32", help="Comma separated batch sizes"
+    )
+    parser.add_argument(
+        "--image-kb", type=int, default=2048, help="Size of each decoded image in KB"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Records decoded at the same time"
+    )
+    args = parser.parse_args()
+
+    # A fresh interpreter per measurement keeps ru_maxrss independent between runs.
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"{'mode':<10} {'batch':>5} {'payload MB':>10} {'peak RSS MB':>11} {'overhead MB':>11}")
+    payload_path = os.path.join(tempfile.mkdtemp(), "payload.json")
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        write_payload(payload_path, batch_size, args.image_kb)
+        for mode in ("get_json", "streaming"):
+            process = context.Process(
+                target=measure,
+                args=(mode, payload_path, batch_size, args.concurrency, results),
+            )
+            process.start()
+            row = results.get()
+            process.join()
+            print(
+                f"{row['mode']:<10} {row['batch_size']:>5} {row['payload_mb']:>10} "
+                f"{row['peak_rss_mb']:>11} {row['overhead_mb']:>11}"
+            )
+    os.remove(payload_path)
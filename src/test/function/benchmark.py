@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Configure the function app before it is imported: no warm-up against a real
+# endpoint, and no result cache unless asked for (synthetic images never repeat anyway).
+os.environ.setdefault("AI_VISION_ENDPOINT", "https://localhost.invalid/")
+os.environ["STARTUP_WARMUP"] = "false"
+os.environ.setdefault("RESULT_CACHE_MAX_ENTRIES", "0")
+os.environ.setdefault("METRICS_LOG_INTERVAL", "0")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "function"))
+
+import azure.functions as func  # noqa: E402
+import function_app  # noqa: E402
+from fake_vision import FakeCredential, FakeImageAnalysisClient  # noqa: E402
+from throttling import AdaptiveRateLimiter  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def build_request(batch_size, image_kb, use_caption, request_number):
+    values = []
+    for i in range(batch_size):
+        # Random bytes keep every image distinct, so no cache or de-duplication kicks in.
+        image_base64 = base64.b64encode(os.urandom(image_kb * 1024)).decode("utf-8")
+        values.append(
+            {
+                "recordId": f"{request_number}-{i}",
+                "data": {"image": image_base64, "languageCode": "en"},
+            }
+        )
+    return func.HttpRequest(
+        method="POST",
+        url="/api/aivisionapiv4",
+        params={"use_caption": "true" if use_caption else "false"},
+        body=json.dumps({"values": values}).encode("utf-8"),
+    )
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+async def run_scenario(args, batch_size, image_kb, concurrency):
+    """Replays args.requests skill requests, args.in_flight at a time (the indexer's degreeOfParallelism)."""
+    client = FakeImageAnalysisClient(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_tps=args.throttle_tps,
+        retry_after=args.retry_after,
+    )
+    function_app.ai_vision_client = client
+    function_app.ai_vision_credential = FakeCredential()
+    function_app.client_initialized = True
+    function_app.MAX_CONCURRENT_RECORDS = concurrency
+    function_app.rate_limiter = AdaptiveRateLimiter(max_rate=args.vision_tps)
+
+    requests = [
+        build_request(batch_size, image_kb, args.use_caption, n)
+        for n in range(args.requests)
+    ]
+    latencies = []
+    record_errors = 0
+    semaphore = asyncio.Semaphore(args.in_flight)
+
+    async def send(req):
+        nonlocal record_errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await function_app.analyze_batch(req)
+            latencies.append(time.perf_counter() - started)
+            for value in json.loads(response.get_body())["values"]:
+                record_errors += bool(value["errors"])
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(send(req) for req in requests))
+    elapsed = time.perf_counter() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    records = batch_size * args.requests
+    return {
+        "batch_size": batch_size,
+        "image_kb": image_kb,
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "records": records,
+        "elapsed_s": round(elapsed, 3),
+        "records_per_s": round(records / elapsed, 2),
+        "request_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "request_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "request_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "record_errors": record_errors,
+        "vision_calls": client.calls,
+        "vision_throttled": client.throttled,
+        "peak_traced_mb": round(peak_memory / 2**20, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    key = ("batch_size", "image_kb", "concurrency")
+    previous = {tuple(row[k] for k in key): row for row in baseline["scenarios"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):")
+    for row in results:
+        old = previous.get(tuple(row[k] for k in key))
+        if old is None:
+            continue
+        change = (row["records_per_s"] / old["records_per_s"] - 1) * 100
+        print(
+            f"  batch={row['batch_size']} image={row['image_kb']}KB concurrency={row['concurrency']}: "
+            f"{old['records_per_s']} -> {row['records_per_s']} records/s ({change:+.1f}%), "
+            f"p95 {old['request_p95_ms']} -> {row['request_p95_ms']} ms"
+        )
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+async def main(args):
+    results = []
+    print(
+        f"{'batch':>5} {'imageKB':>7} {'conc':>4} {'rec/s':>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'429s':>5} {'peak MB':>8}"
+    )
+    for batch_size, image_kb, concurrency in itertools.product(
+        args.batch_sizes, args.image_kb, args.concurrency
+    ):
+        row = await run_scenario(args, batch_size, image_kb, concurrency)
+        results.append(row)
+        print(
+            f"{row['batch_size']:>5} {row['image_kb']:>7} {row['concurrency']:>4} "
+            f"{row['records_per_s']:>8} {row['request_p50_ms']:>8} {row['request_p95_ms']:>8} "
+            f"{row['request_p99_ms']:>8} {row['record_errors']:>6} {row['vision_throttled']:>5} "
+            f"{row['peak_traced_mb']:>8}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "revision": git_revision(),
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "profile": {
+                        "latency_ms": args.latency_ms,
+                        "jitter_ms": args.jitter_ms,
+                        "error_rate": args.error_rate,
+                        "throttle_tps": args.throttle_tps,
+                        "vision_tps": args.vision_tps,
+                        "in_flight": args.in_flight,
+                        "use_caption": args.use_caption,
+                    },
+                    "scenarios": results,
+                },
+                output_file,
+                indent=2,
+            )
+        logger.warning(f"Results written to {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark aivisionapiv4 in-process against a fake AI Vision client"
+    )
+    parser.add_argument("--batch-sizes", type=parse_list, default=[1, 4, 8])
+    parser.add_argument("--image-kb", type=parse_list, default=[256])
+    parser.add_argument(
+        "--concurrency",
+        type=parse_list,
+        default=[1, 4],
+        help="MAX_CONCURRENT_RECORDS values to test",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=20, help="Skill requests per scenario"
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=5,
+        help="Concurrent skill requests (the indexer's degreeOfParallelism)",
+    )
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--throttle-tps",
+        type=int,
+        default=0,
+        help="Fake service TPS limit; 0 disables throttling",
+    )
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument(
+        "--vision-tps", type=float, default=100, help="Client-side limiter rate"
+    )
+    parser.add_argument("--use-caption", action="store_true")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Compare with a previous --output file")
+    asyncio.run(main(parser.parse_args()))
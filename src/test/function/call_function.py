@@ -1,10 +1,17 @@
+import argparse
 import base64
+import itertools
 import logging
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import requests
 from azure.identity import DefaultAzureCredential
 from dotenv import find_dotenv, load_dotenv
+from requests.adapters import HTTPAdapter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,85 +19,223 @@ logger = logging.getLogger(__name__)
 
 load_dotenv(find_dotenv())
 
-AZURE_CLIENT_ID = os.getenv("AZURE_CLIENT_ID")
-AZURE_CLIENT_SECRET = os.getenv("AZURE_CLIENT_SECRET")
-AZURE_TENANT_ID = os.getenv("AZURE_TENANT_ID")
 FUNCTION_ENDPOINT = os.getenv("FUNCTION_ENDPOINT")
 FUNCTION_APP_CLIENT_ID = os.getenv("FUNCTION_APP_CLIENT_ID")
 FUNCTION_KEY = os.getenv("FUNCTION_KEY")
 
-if FUNCTION_KEY is None:
-    logger.info("No function key provided. Using managed identity.")
-    credential = DefaultAzureCredential()
-    headers = {}
-    try:
-        token = credential.get_token(f"api://{FUNCTION_APP_CLIENT_ID}/.default").token
-        headers["Authorization"] = f"Bearer {token}"
-        logger.info("Access token obtained and added to headers.")
-    except Exception as e:
-        logger.error(f"Error obtaining access token: {e}")
-        raise
-else:
-    logger.info("Function key provided. Using function key.")
-
-uri = f"{FUNCTION_ENDPOINT}/api/aivisionapiv4"
-
-params = {}
-if FUNCTION_KEY is not None:
-    params["code"] = FUNCTION_KEY
-params["use_caption"] = "false"
-
-image_file = "thrive35.png"
-
-# Convert to base64
-try:
-    with open(image_file, "rb") as image:
-        image_base64 = base64.b64encode(image.read()).decode("utf-8")
-    logger.info("Image converted to base64 successfully.")
-except Exception as e:
-    logger.error(f"Error converting image to base64: {e}")
-    raise
-
-data = {
-    "values": [
-        {
-            "recordId": "1",
-            "data": {
-                "image": image_base64,
-            },
-        }
-    ]
-}
-
-headers = {"Content-Type": "application/json"}
-
-try:
-    response = requests.post(uri, json=data, headers=headers, params=params)
-    response.raise_for_status()
-    logger.info("Request sent successfully.")
-    logger.info(f"Response: {response.json()}")
-except requests.exceptions.RequestException as e:
-    logger.error(f"Error sending request: {e}")
-    raise
-
-if response.status_code == 401:
-    logger.error("Unauthorized. Switching to managed identity.")
-    credential = DefaultAzureCredential()
-
-    headers = {}
-    try:
-        token = credential.get_token(f"api://{FUNCTION_APP_CLIENT_ID}/.default").token
-        headers["Authorization"] = f"Bearer {token}"
-        logger.info("Access token obtained and added to headers.")
-    except Exception as e:
-        logger.error(f"Error obtaining access token: {e}")
-        raise
-
-    try:
-        response = requests.post(uri, json=data, headers=headers, params=params)
-        response.raise_for_status()
-        logger.info("Request sent successfully.")
-        logger.info(f"Response: {response.json()}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending request: {e}")
-        raise
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+
+class BearerToken:
+    """Fetches one token for the Function App and reuses it until shortly before it expires."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self._credential = DefaultAzureCredential()
+        self._token = None
+        self._lock = threading.Lock()
+
+    def header(self, force_refresh=False):
+        with self._lock:
+            if (
+                force_refresh
+                or self._token is None
+                or self._token.expires_on - time.time() < 300
+            ):
+                self._token = self._credential.get_token(self.scope)
+                logger.info("Access token obtained.")
+            return f"Bearer {self._token.token}"
+
+
+def encode_image(path):
+    with open(path, "rb") as image:
+        return base64.b64encode(image.read()).decode("utf-8")
+
+
+def load_images(image_dir, workers):
+    """Base64-encodes every image of image_dir in a process pool."""
+    paths = sorted(
+        os.path.join(image_dir, name)
+        for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise ValueError(f"No images found in {image_dir}")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        encoded = list(pool.map(encode_image, paths))
+    logger.info(f"Encoded {len(encoded)} images from {image_dir}.")
+    return encoded
+
+
+def build_batches(images, batch_size, request_count, language_code):
+    """Packs the images into skill-shaped payloads, cycling through them as needed."""
+    image_cycle = itertools.cycle(images)
+    batches = []
+    for request_number in range(request_count):
+        values = []
+        for i in range(batch_size):
+            data = {"image": next(image_cycle)}
+            if language_code:
+                data["languageCode"] = language_code
+            values.append({"recordId": f"{request_number}-{i}", "data": data})
+        batches.append({"values": values})
+    return batches
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+class LoadGenerator:
+    def __init__(self, uri, params, concurrency, bearer_token=None, timeout=230):
+        self.uri = uri
+        self.params = params
+        self.bearer_token = bearer_token
+        self.timeout = timeout
+        # One keep-alive connection per in-flight request, reused for the whole run.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.concurrency = concurrency
+        self.request_latencies = []
+        self.record_latencies = []
+        self.errors = Counter()
+        self.records_ok = 0
+        self._lock = threading.Lock()
+
+    def send(self, payload):
+        headers = {"Content-Type": "application/json"}
+        if self.bearer_token:
+            headers["Authorization"] = self.bearer_token.header()
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.uri,
+                json=payload,
+                headers=headers,
+                params=self.params,
+                timeout=self.timeout,
+            )
+            if response.status_code == 401 and self.bearer_token:
+                logger.warning("Unauthorized. Refreshing the access token and retrying.")
+                headers["Authorization"] = self.bearer_token.header(force_refresh=True)
+                response = self.session.post(
+                    self.uri,
+                    json=payload,
+                    headers=headers,
+                    params=self.params,
+                    timeout=self.timeout,
+                )
+        except requests.exceptions.RequestException as e:
+            with self._lock:
+                self.errors[f"request: {type(e).__name__}"] += 1
+            return
+        latency = time.perf_counter() - started
+        values = None
+        if response.status_code == 200:
+            try:
+                values = response.json().get("values", [])
+            except ValueError:
+                # e.g. an HTML error page from the host answering 200
+                pass
+
+        with self._lock:
+            self.request_latencies.append(latency)
+            if response.status_code != 200:
+                self.errors[f"HTTP {response.status_code}"] += 1
+                return
+            if values is None:
+                self.errors["HTTP 200 with a non-JSON body"] += 1
+                return
+            for value in values:
+                self.record_latencies.append(latency)
+                if value.get("errors"):
+                    for error in value["errors"]:
+                        self.errors[f"record: {error.get('message', '')[:80]}"] += 1
+                else:
+                    self.records_ok += 1
+
+    def run(self, batches):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(self.send, batches))
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        requests_sent = len(self.request_latencies)
+        logger.info(f"Requests completed: {requests_sent} in {elapsed:.1f}s")
+        logger.info(f"Requests/sec: {requests_sent / elapsed:.2f}")
+        logger.info(
+            f"Records/sec: {len(self.record_latencies) / elapsed:.2f} "
+            f"({self.records_ok} without errors)"
+        )
+        for percent in (50, 95, 99):
+            value = percentile(self.record_latencies, percent)
+            if value is not None:
+                logger.info(f"Record latency p{percent}: {value * 1000:.0f}ms")
+        if self.errors:
+            logger.info("Errors:")
+            for message, count in self.errors.most_common():
+                logger.info(f"  {count:>6}  {message}")
+        else:
+            logger.info("No errors.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Send skill-shaped batches of images to the aivisionapiv4 function"
+    )
+    parser.add_argument(
+        "--images",
+        default=os.path.dirname(os.path.abspath(__file__)),
+        help="Directory of images to send",
+    )
+    parser.add_argument(
+        "--endpoint",
+        default=FUNCTION_ENDPOINT,
+        help="Function App base URL, e.g. http://localhost:7071 for a local stand-in",
+    )
+    parser.add_argument("--batch-size", type=int, default=1, help="Records per request")
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Requests kept in flight"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=1, help="Total number of requests to send"
+    )
+    parser.add_argument("--use-caption", action="store_true")
+    parser.add_argument("--language", help="languageCode sent with every record")
+    parser.add_argument(
+        "--encode-workers", type=int, default=None, help="Processes used for encoding"
+    )
+    args = parser.parse_args()
+
+    params = {"use_caption": "true" if args.use_caption else "false"}
+    bearer_token = None
+    if FUNCTION_KEY is None:
+        logger.info("No function key provided. Using managed identity.")
+        bearer_token = BearerToken(f"api://{FUNCTION_APP_CLIENT_ID}/.default")
+        bearer_token.header()
+    else:
+        logger.info("Function key provided. Using function key.")
+        params["code"] = FUNCTION_KEY
+
+    images = load_images(args.images, args.encode_workers)
+    batches = build_batches(images, args.batch_size, args.requests, args.language)
+
+    generator = LoadGenerator(
+        f"{args.endpoint}/api/aivisionapiv4", params, args.concurrency, bearer_token
+    )
+    logger.info(
+        f"Sending {args.requests} requests of {args.batch_size} records, "
+        f"{args.concurrency} in flight."
+    )
+    elapsed = generator.run(batches)
+    generator.report(elapsed)
+
+
+if __name__ == "__main__":
+    main()
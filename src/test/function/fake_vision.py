@@ -0,0 +1,147 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from azure.core.exceptions import HttpResponseError
+
+
+class FakeResponse:
+    """Just enough of an azure-core HTTP response for HttpResponseError and throttling.py."""
+
+    def __init__(self, status_code, reason, headers=None):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers or {}
+
+    def text(self, encoding=None):
+        return ""
+
+
+class FakeCredential:
+    """Stands in for RefreshingTokenCredential."""
+
+    async def get_token(self, *scopes, **kwargs):
+        return SimpleNamespace(token="fake", expires_on=time.time() + 3600)
+
+    def metrics(self):
+        return {"refreshes": 0, "refresh_failures": 0}
+
+
+class FakeImageAnalysisClient:
+    """
+    Local stand-in for the aio ImageAnalysisClient.
+
+    :param latency_ms: Mean latency of one analyze call.
+    :param jitter_ms: Standard deviation of the latency.
+    :param error_rate: Share of calls failing with HTTP 500.
+    :param throttle_tps: Provisioned TPS; calls above it get HTTP 429 (0 disables).
+    :param retry_after: Retry-After seconds sent with 429 responses.
+    :param caption_languages: Languages accepted with CAPTION; others get NotSupportedLanguage (None accepts all).
+    """
+
+    def __init__(
+        self,
+        latency_ms=300,
+        jitter_ms=50,
+        error_rate=0.0,
+        throttle_tps=0,
+        retry_after=1,
+        caption_languages=None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_tps = throttle_tps
+        self.retry_after = retry_after
+        self.caption_languages = caption_languages
+        self.calls = 0
+        self.throttled = 0
+        self.failed = 0
+        self._window_started = time.monotonic()
+        self._window_calls = 0
+
+    async def analyze(self, image_data, visual_features, language=None, **kwargs):
+        self.calls += 1
+        if self._is_throttled():
+            self.throttled += 1
+            raise self._error(429, "Too Many Requests", {"Retry-After": str(self.retry_after)})
+
+        latency = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(latency)
+
+        if random.random() < self.error_rate:
+            self.failed += 1
+            raise self._error(500, "Internal Server Error")
+
+        features = {str(getattr(f, "value", f)).lower() for f in visual_features}
+        if (
+            "caption" in features
+            and self.caption_languages is not None
+            and language not in self.caption_languages
+        ):
+            self.failed += 1
+            raise self._error(
+                400, f"NotSupportedLanguage: caption is not supported for '{language}'"
+            )
+
+        lines = []
+        for i in range(3):
+            text = f"line {i} of a {len(image_data)} byte image"
+            words = [
+                SimpleNamespace(
+                    text=word,
+                    confidence=round(random.uniform(0.5, 1.0), 3),
+                    bounding_polygon=_box(10 + 60 * n, 10 + 30 * i, 50, 20),
+                )
+                for n, word in enumerate(text.split())
+            ]
+            lines.append(
+                SimpleNamespace(
+                    text=text,
+                    words=words,
+                    bounding_polygon=_box(10, 10 + 30 * i, 60 * len(words), 20),
+                )
+            )
+        return SimpleNamespace(
+            read=SimpleNamespace(blocks=[SimpleNamespace(lines=lines)]),
+            caption=(
+                SimpleNamespace(text="a synthetic image", confidence=0.9)
+                if "caption" in features
+                else None
+            ),
+        )
+
+    async def send_request(self, request, **kwargs):
+        return SimpleNamespace(read=_noop)
+
+    def _is_throttled(self):
+        if not self.throttle_tps:
+            return False
+        now = time.monotonic()
+        if now - self._window_started >= 1:
+            self._window_started = now
+            self._window_calls = 0
+        self._window_calls += 1
+        return self._window_calls > self.throttle_tps
+
+    @staticmethod
+    def _error(status_code, reason, headers=None):
+        error = HttpResponseError(message=f"({status_code}) {reason}")
+        error.status_code = status_code
+        error.reason = reason
+        error.response = FakeResponse(status_code, reason, headers)
+        return error
+
+
+def _box(x, y, width, height):
+    return [
+        SimpleNamespace(x=x, y=y),
+        SimpleNamespace(x=x + width, y=y),
+        SimpleNamespace(x=x + width, y=y + height),
+        SimpleNamespace(x=x, y=y + height),
+    ]
+
+
+async def _noop():
+    return b""